@@ -0,0 +1,173 @@
+# uvicorn asgi:app
+# The same app behind an ASGI server. The event loop reads request bodies and
+# writes responses, so a slow client uploading a cover or downloading a file
+# costs a coroutine rather than a thread. Views are unchanged and still run
+# synchronously, in a bounded pool of ASGI_THREADS threads.
+import asyncio
+import contextvars
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from tempfile import SpooledTemporaryFile
+
+from werkzeug.wsgi import FileWrapper
+
+from app import create_app
+from file_server import file_chunks
+
+
+def no_write(data):
+    raise NotImplementedError('write() is not supported, return an iterable instead')
+
+
+class ASGIAdapter:
+    # Runs a WSGI app for an ASGI server:
+    # - the request body is read in full on the event loop, and spooled to a
+    #   temporary file when larger than ASGI_SPOOL_SIZE, before the view
+    #   takes a thread;
+    # - files from send_file() (wsgi.file_wrapper) are read ASGI_CHUNK_SIZE
+    #   at a time and each chunk is sent once the client has taken the last;
+    # - other responses with a Content-Length are built in the view's thread
+    #   and sent from the loop;
+    # - streamed responses are iterated in a separate pool, so long-lived
+    #   /events streams cannot take the threads the views need.
+
+    def __init__(self, app):
+        self.app = app
+        self.spool_size = app.config['ASGI_SPOOL_SIZE']
+        self.chunk_size = app.config['ASGI_CHUNK_SIZE']
+        self.views = ThreadPoolExecutor(app.config['ASGI_THREADS'], 'asgi-view')
+        self.streams = ThreadPoolExecutor(app.config['ASGI_STREAM_THREADS'], 'asgi-stream')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError(f"Unsupported ASGI scope type {scope['type']!r}")
+
+        body, length = await self.read_body(receive)
+        if body is None:
+            return  # The client went away mid-upload
+        disconnected = asyncio.Event()
+        watcher = asyncio.ensure_future(self.watch_disconnect(receive, disconnected))
+        try:
+            await self.respond(self.environ(scope, body, length), send, disconnected)
+        finally:
+            watcher.cancel()
+            body.close()
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.views.shutdown(wait=False)
+                self.streams.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def read_body(self, receive):
+        body = SpooledTemporaryFile(self.spool_size)
+        length = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                return None, 0
+            chunk = message.get('body', b'')
+            # Past the spool size this is a write to a temporary file, which
+            # lands in the page cache without waiting for the disk
+            body.write(chunk)
+            length += len(chunk)
+            if not message.get('more_body', False):
+                body.seek(0)
+                return body, length
+
+    async def watch_disconnect(self, receive, disconnected):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        disconnected.set()
+
+    def environ(self, scope, body, length):
+        root_path = scope.get('root_path', '')
+        path = scope['path'][len(root_path):] if scope['path'].startswith(root_path) else scope['path']
+        server = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': root_path.encode().decode('latin-1'),
+            'PATH_INFO': path.encode().decode('latin-1'),
+            'QUERY_STRING': scope['query_string'].decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+            'CONTENT_LENGTH': str(length),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+            'wsgi.file_wrapper': FileWrapper,
+        }
+        if scope.get('client'):
+            environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = scope['client'][0], str(scope['client'][1])
+        for name, value in scope['headers']:
+            key = name.decode('latin-1').upper().replace('-', '_')
+            if key == 'CONTENT_LENGTH':
+                continue  # The body has been read, its real length is set above
+            if key != 'CONTENT_TYPE':
+                key = f'HTTP_{key}'
+            value = value.decode('latin-1')
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+        return environ
+
+    async def respond(self, environ, send, disconnected):
+        loop = asyncio.get_running_loop()
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [int(status.split(' ', 1)[0]), [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]]
+            return no_write
+
+        def call():
+            iterable = self.app(environ, start_response)
+            if isinstance(iterable, FileWrapper) or not any(name == b'content-length' for name, _ in started[1]):
+                return iterable, None
+            try:
+                return None, b''.join(iterable)
+            finally:
+                if hasattr(iterable, 'close'):
+                    iterable.close()
+
+        # Every step runs in the same context: stream_with_context() pushes
+        # the request context in one step and pops it in a later one, which
+        # may be on another thread
+        context = contextvars.copy_context()
+        iterable, body = await loop.run_in_executor(self.views, context.run, call)
+        await send({'type': 'http.response.start', 'status': started[0], 'headers': started[1]})
+        if iterable is None:
+            await send({'type': 'http.response.body', 'body': body})
+            return
+
+        if isinstance(iterable, FileWrapper):
+            length = int(dict(started[1]).get(b'content-length', sys.maxsize))
+            executor, read = self.views, partial(context.run, next, file_chunks(iterable.file, length, self.chunk_size), None)
+        else:
+            executor, read = self.streams, partial(context.run, next, iter(iterable), None)
+        try:
+            while not disconnected.is_set():
+                chunk = await loop.run_in_executor(executor, read)
+                if chunk is None:
+                    break
+                if chunk:
+                    # Waits while the client is slower than the server
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(iterable, 'close'):
+                await loop.run_in_executor(executor, context.run, iterable.close)
+
+
+app = ASGIAdapter(create_app())
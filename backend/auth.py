@@ -0,0 +1,87 @@
+from functools import wraps
+
+import jwt
+from flask import Blueprint, current_app, g, jsonify, request, session
+
+from extensions import db, password_hasher, token_cache
+from models import User
+from password_pool import PoolSaturated
+from token_cache import Principal
+
+
+bp = Blueprint('auth', __name__)
+
+
+def authenticate(token):
+    # Returns (Principal, None) for a valid token, or (None, error message)
+    # Tokens seen recently skip both jwt.decode and the user lookup
+    principal = token_cache.get(token)
+    if principal is None:
+        try:
+            payload = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
+        except jwt.ExpiredSignatureError:
+            return None, 'Token has expired'
+        except jwt.InvalidTokenError:
+            return None, 'Invalid token'
+
+        user = User.query.get(payload['sub'])
+        if not user:
+            return None, 'Invalid token'
+        principal = Principal(user.id, user.is_admin)
+        token_cache.set(token, principal, payload['exp'])
+    return principal, None
+
+
+def login_required(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        token = request.headers.get('Authorization', '').split()
+
+        if not token or token[0] != 'Bearer':
+            return jsonify({'message': 'Authorization header is missing or invalid'}), 401
+
+        principal, error = authenticate(token[1])
+        if error:
+            return jsonify({'message': error}), 401
+
+        g.user = principal
+        return func(*args, **kwargs)
+
+    return wrapper
+
+
+@bp.route('/register', methods=['POST'])
+def register():
+    data = request.get_json()
+    hashed_password = password_hasher.hash(data['password'])
+    is_admin = data.get('is_admin', False)  # Default to False if not provided
+    new_user = User(name=data['name'], city=data['city'], age=data['age'], username=data['username'], password=hashed_password, is_admin=is_admin)
+    db.session.add(new_user)
+    db.session.commit()
+    token = new_user.generate_token()
+    return jsonify({'token': token})
+
+
+@bp.route('/login', methods=['POST'])
+def login():
+    data = request.get_json()
+    user = User.query.filter_by(username=data['username']).first()
+
+    if user and password_hasher.verify(user.password, data['password']):
+        # Upgrade hashes made with older parameters while the password is at hand
+        if password_hasher.needs_rehash(user.password):
+            try:
+                user.password = password_hasher.hash(data['password'])
+                db.session.commit()
+            except PoolSaturated:
+                pass
+        token = user.generate_token()
+        response_data = {'token': token, 'is_admin': user.is_admin}  # Include is_admin field in the response
+        return jsonify(response_data)
+    return jsonify({'message': 'Invalid credentials'}), 401
+
+
+@bp.route('/logout', methods=['POST'])
+def logout():
+    session.pop('username', None)
+    return jsonify({'message': 'Logout successful'}), 200
@@ -0,0 +1,448 @@
+import mimetypes
+import os
+import zipfile
+from datetime import datetime
+from functools import partial
+
+import click
+from flask import Blueprint, abort, current_app, jsonify, request, send_file
+from sqlalchemy.dialects import postgresql, sqlite
+from werkzeug.security import safe_join
+from werkzeug.utils import secure_filename
+
+import bulk_import
+import covers
+from auth import login_required
+from catalog import bump_catalog_version, cached_response
+from events import publish_after_commit
+from extensions import db, thumbnail_cache
+from file_server import offload_headers
+from loans import checkin_books
+from models import Book, BookLoanCount, Cover, Loan
+from pagination import decode_cursor, keyset_page, parse_int_arg, parse_limit, search_args, search_results
+from search import book_index
+from serializers import RowSerializer
+from thumbnails import FORMATS as THUMBNAIL_FORMATS
+
+
+bp = Blueprint('books', __name__, cli_group=None)
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+
+# Columns that can be requested from GET /books with ?fields=
+BOOK_FIELDS = {
+    'id': Book.id,
+    'name': Book.name,
+    'author': Book.author,
+    'year_published': Book.year_published,
+    'book_type': Book.book_type,
+    'customer_id': Book.customer_id,
+    'image': Book.image_path
+}
+# A free book's customer_id has always been written as the string "None"
+book_rows = RowSerializer(BOOK_FIELDS, converters={'customer_id': lambda value: "None" if value is None else value})
+
+
+def book_event(book):
+    # The book as GET /books writes it. It is read back from the flushed row:
+    # the attributes may still hold the strings a form set them to.
+    db.session.flush()
+    row = db.session.execute(db.select(*BOOK_FIELDS.values()).where(Book.id == book.id)).one()
+    return book_rows([row])[0]
+
+
+@bp.route('/books', methods=['GET'])
+@login_required
+@cached_response
+def get_books():
+    try:
+        limit = parse_limit(request.args.get('limit'))
+        after = decode_cursor(request.args.get('cursor'))
+        book_type = parse_int_arg('book_type')
+        year_published = parse_int_arg('year_published')
+
+        fields = list(BOOK_FIELDS)
+        if request.args.get('fields'):
+            fields = [field.strip() for field in request.args['fields'].split(',') if field.strip()]
+            unknown = [field for field in fields if field not in BOOK_FIELDS]
+            if unknown:
+                raise ValueError('Unknown fields: ' + ', '.join(unknown))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+    # Only the requested columns are selected; id is always needed for the cursor
+    columns = [Book.id] + [BOOK_FIELDS[field].label(field) for field in fields if field != 'id']
+    query = db.select(*columns)
+
+    if request.args.get('author'):
+        query = query.where(Book.author == request.args['author'])
+    if book_type is not None:
+        query = query.where(Book.book_type == book_type)
+    if year_published is not None:
+        query = query.where(Book.year_published == year_published)
+    available = request.args.get('available')
+    if available is not None:
+        if available.lower() in ('1', 'true', 'yes'):
+            query = query.where(Book.customer_id.is_(None))
+        else:
+            query = query.where(Book.customer_id.isnot(None))
+
+    rows, next_cursor = keyset_page(query, Book.id, limit, after)
+
+    book_list = book_rows.only(fields, [column.key for column in columns])(rows)
+    return jsonify({'books': book_list, 'next': next_cursor})
+
+
+@bp.route('/books/<int:book_id>', methods=['GET'])
+@login_required
+@cached_response
+def get_book(book_id):
+    book = Book.query.get(book_id)
+    if book:
+        return jsonify({'id': book.id, 'name': book.name, 'author': book.author, 'year_published': book.year_published, 'book_type': book.book_type, 'customer_id': book.customer_id if book.customer_id is not None else "None", 'image': book.image_path})
+    return jsonify({'message': 'Book not found'}), 404
+
+
+def store_cover(stream, extension):
+    # Store an image under its content hash and take a reference to it.
+    # Returns the image_path for the book; the caller commits.
+    digest, tmp_path = covers.spool(stream, current_app.config['UPLOAD_FOLDER'])
+    try:
+        # One upsert rather than a lookup and then an insert, which two uploads
+        # of the same image would race on
+        dialect = postgresql if db.session.get_bind().dialect.name == 'postgresql' else sqlite
+        statement = dialect.insert(Cover).values(digest=digest, name=covers.cover_name(digest, extension), refcount=1)
+        statement = statement.on_conflict_do_update(
+            index_elements=['digest'], set_={'refcount': Cover.refcount + 1}
+        ).returning(Cover.name)
+        name = db.session.execute(statement).scalar_one()
+        covers.place(tmp_path, current_app.config['UPLOAD_FOLDER'], name)
+    except BaseException:
+        covers.discard(tmp_path)
+        raise
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], name)
+
+
+def save_cover(book_image):
+    extension = secure_filename(book_image.filename).rsplit('.', 1)[1].lower()
+    return store_cover(book_image.stream, extension)
+
+
+def release_cover(image_path):
+    # Drop a book's reference to its cover. Returns the digest of the cover so
+    # it can be collected after commit, or None for images stored before covers
+    # were content-addressed.
+    if not image_path:
+        return None
+    name = os.path.relpath(image_path, current_app.config['UPLOAD_FOLDER']).replace(os.sep, '/')
+    cover = Cover.query.filter_by(name=name).first()
+    if not cover:
+        return None
+    db.session.execute(
+        db.update(Cover).where(Cover.digest == cover.digest).values(refcount=Cover.refcount - 1)
+    )
+    return cover.digest
+
+
+def collect_cover(digest):
+    # Delete a cover nobody references any more. Call after committing release_cover().
+    # The file is moved aside while the DELETE holds the row and removed once
+    # it has committed: an upload of the same image meanwhile waits for the
+    # row, then finds no file and stores its own copy.
+    if digest is None:
+        return
+    name = db.session.execute(
+        db.delete(Cover).where(Cover.digest == digest, Cover.refcount <= 0).returning(Cover.name)
+    ).scalar_one_or_none()
+    if name is None:
+        db.session.rollback()
+        return
+    hidden = covers.hide(current_app.config['UPLOAD_FOLDER'], name)
+    try:
+        db.session.commit()
+    except BaseException:
+        covers.unhide(hidden, current_app.config['UPLOAD_FOLDER'], name)
+        raise
+    if hidden:
+        covers.discard(hidden)
+
+
+@bp.route('/books', methods=['POST'])
+@login_required
+def add_book():
+    data = request.form
+    book_name = data['name']
+    author = data['author']
+    year_published = data['year_published']
+    book_type = data['book_type']
+    book_image = request.files.get('image')
+
+    # Validate file extension
+    if book_image and allowed_file(book_image.filename):
+        # Save the uploaded image under its content hash
+        file_path = save_cover(book_image)
+
+        # Create a new Book record in the database
+        new_book = Book(name=book_name, author=author, year_published=year_published, book_type=book_type, image_path=file_path, customer_id=None)
+        db.session.add(new_book)
+        bump_catalog_version()
+        publish_after_commit('book.added', book_event(new_book))
+        db.session.commit()
+        
+        return jsonify({'message': 'Book added successfully'})
+    else:
+        return jsonify({'message': 'Invalid file or file format'}), 400
+
+@bp.route('/books/<int:book_id>', methods=['PUT'])
+@login_required
+def update_book(book_id):
+    data = request.form
+    book = Book.query.get(book_id)
+    if book:
+
+        book.name = data.get('name', book.name)
+        book.author = data.get('author', book.author)
+        book.year_published = data.get('year_published', book.year_published)
+        book.book_type = data.get('book_type', book.book_type)
+        
+        # Update the image if provided
+        released = None
+        if 'image' in request.files:
+            book_image = request.files['image']
+            if book_image and allowed_file(book_image.filename):
+                file_path = save_cover(book_image)
+                released = release_cover(book.image_path)
+                book.image_path = file_path
+            else:
+                return jsonify({'message': 'Invalid file or file format for image'}), 400
+        
+        bump_catalog_version()
+        publish_after_commit('book.updated', book_event(book))
+        db.session.commit()
+        collect_cover(released)
+        return jsonify({'message': 'Book updated successfully'})
+    return jsonify({'message': 'Book not found'}), 404
+
+
+
+@bp.route('/books/<int:book_id>', methods=['DELETE'])
+def delete_book(book_id):
+    book = Book.query.get(book_id)
+    if book:
+        # Return the book first if it is out: its open loan would otherwise be
+        # left open forever with no book (and no way to return it)
+        holder = db.session.scalar(
+            db.select(Loan.customer_id).where(Loan.book_id == book_id, Loan.return_date.is_(None))
+        )
+        if holder is not None:
+            checkin_books(holder, [book_id], datetime.utcnow())
+        released = release_cover(book.image_path)
+        db.session.delete(book)
+        db.session.execute(db.delete(BookLoanCount).where(BookLoanCount.book_id == book_id))
+        bump_catalog_version()
+        publish_after_commit('book.deleted', {'id': book_id})
+        db.session.commit()
+        collect_cover(released)
+        return jsonify({'message': 'Book deleted successfully'})
+    return jsonify({'message': 'Book not found'}), 404
+
+
+def import_books(stream, file_format, batch_size, archive=None):
+    # Insert the rows of a CSV or NDJSON catalog in batches of batch_size, one
+    # multi-row INSERT and one transaction per batch. Invalid rows are skipped
+    # and reported by line number. `archive` is an optional zipfile.ZipFile
+    # holding the covers named in the rows' `image` column.
+    report = {'imported': 0, 'failed': 0, 'errors': []}
+    max_errors = current_app.config['IMPORT_MAX_ERRORS']
+    batch = []
+
+    def fail(line_number, error):
+        report['failed'] += 1
+        if len(report['errors']) < max_errors:
+            report['errors'].append({'line': line_number, 'error': error})
+
+    def flush():
+        if batch:
+            db.session.execute(db.insert(Book), batch)
+            bump_catalog_version()
+            publish_after_commit('books.imported', {'count': len(batch)})
+            db.session.commit()
+            report['imported'] += len(batch)
+            batch.clear()
+
+    for line_number, row, error in bulk_import.read_rows(stream, file_format):
+        if error:
+            fail(line_number, error)
+            continue
+        try:
+            values = bulk_import.validate_row(row)
+            image = row.get('image')
+            if image:
+                if archive is None:
+                    raise ValueError('image given but no covers archive was uploaded')
+                if not allowed_file(image):
+                    raise ValueError('Invalid file format for image')
+                try:
+                    member = archive.getinfo(image)
+                except KeyError:
+                    raise ValueError(f'{image} is not in the covers archive')
+                with archive.open(member) as image_stream:
+                    values['image_path'] = store_cover(image_stream, image.rsplit('.', 1)[1].lower())
+        except ValueError as e:
+            fail(line_number, str(e))
+            continue
+
+        batch.append(values)
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+    return report
+
+
+@bp.route('/books/bulk', methods=['POST'])
+@login_required
+def bulk_add_books():
+    catalog = request.files.get('file')
+    if not catalog:
+        return jsonify({'message': 'file is missing'}), 400
+    try:
+        file_format = bulk_import.detect_format(catalog.filename, request.form.get('format'))
+        batch_size = int(request.form.get('batch_size', current_app.config['IMPORT_BATCH_SIZE']))
+        if batch_size < 1:
+            raise ValueError('batch_size must be positive')
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+    archive = None
+    if request.files.get('covers'):
+        try:
+            archive = zipfile.ZipFile(request.files['covers'].stream)
+        except zipfile.BadZipFile:
+            return jsonify({'message': 'covers must be a zip archive'}), 400
+
+    try:
+        report = import_books(catalog.stream, file_format, batch_size, archive)
+    finally:
+        if archive:
+            archive.close()
+    return jsonify(report), 200
+
+
+@bp.cli.command('import-books')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--covers', 'covers_path', type=click.Path(exists=True, dir_okay=False), help='Zip archive with the covers named in the image column.')
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'ndjson']), help='Defaults to the file extension.')
+@click.option('--batch-size', type=int, default=None, help='Rows per INSERT and transaction.')
+def import_books_command(path, covers_path, file_format, batch_size):
+    """Import books from a CSV or NDJSON file."""
+    try:
+        file_format = bulk_import.detect_format(path, file_format)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    archive = zipfile.ZipFile(covers_path) if covers_path else None
+    try:
+        with open(path, 'rb') as stream:
+            report = import_books(stream, file_format, batch_size or current_app.config['IMPORT_BATCH_SIZE'], archive)
+    finally:
+        if archive:
+            archive.close()
+
+    click.echo(f"Imported {report['imported']} books, {report['failed']} rows failed")
+    for error in report['errors']:
+        click.echo(f"  line {error['line']}: {error['error']}")
+
+
+@bp.route('/books/find', methods=['GET'])
+@cached_response
+def find_book_by_name():
+    try:
+        # Ranked, typo-tolerant search over name and author
+        if 'q' in request.args:
+            try:
+                query, limit, offset = search_args()
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            books, next_offset = search_results(book_index, Book, query, limit, offset)
+            book_list = [{'id': book.id, 'name': book.name, 'author': book.author, 'year_published': book.year_published, 'book_type': book.book_type, 'image_path': book.image_path} for book in books]
+            return jsonify({'books': book_list, 'next_offset': next_offset}), 200
+
+        # Get the book name from the query parameters
+        book_name = request.args.get('name')
+        
+        if not book_name:
+            return jsonify({'error': 'Book name parameter is missing'}), 400
+            
+        # Query the database to find the book by name
+        book = Book.query.filter_by(name=book_name).first()
+
+        if book:
+            # Book found, return its details
+            book_data = {
+                'id': book.id,
+                'name': book.name,
+                'author': book.author,
+                'year_published': book.year_published,
+                'book_type': book.book_type,
+                'image_path': book.image_path  # Corrected key to match JavaScript code
+            }
+            return jsonify(book_data), 200
+        else:
+            # Book not found
+            return jsonify({'error': 'Book not found'}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def send_upload(path, accel_uri, etag=True, immutable=False):
+    # Content-addressed files may be cached for UPLOAD_MAX_AGE; anything else
+    # is revalidated with its ETag on every use
+    offload = current_app.config['UPLOAD_OFFLOAD']
+    max_age = current_app.config['UPLOAD_MAX_AGE'] if immutable else 0
+    if offload:
+        response = current_app.response_class(mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream')
+        response.headers.extend(offload_headers(offload, path, accel_uri))
+        response.cache_control.max_age = max_age
+    else:
+        response = send_file(path, etag=etag, max_age=max_age)
+    if immutable:
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+    return response
+
+
+# Content-addressed originals without a query string are answered by
+# file_server.FileServer before they reach this view
+@bp.route('/uploads/<path:filename>')
+def uploaded_file(filename):
+    try:
+        width = int(request.args.get('w', 0))
+        height = int(request.args.get('h', 0))
+    except ValueError:
+        return jsonify({'message': 'w and h must be integers'}), 400
+    max_size = current_app.config['THUMBNAIL_MAX_SIZE']
+    if width < 0 or height < 0 or width > max_size or height > max_size:
+        return jsonify({'message': f'w and h must be between 1 and {max_size}'}), 400
+
+    source = safe_join(current_app.config['UPLOAD_FOLDER'], filename)
+    if source is None or not os.path.isfile(source):
+        abort(404)
+    original = partial(send_upload, source, current_app.config['UPLOAD_ACCEL_PREFIX'] + filename,
+                       immutable=covers.is_content_addressed(filename))
+    if not width and not height:
+        return original()
+    if source.rsplit('.', 1)[-1].lower() not in THUMBNAIL_FORMATS:
+        abort(404)
+
+    try:
+        path = thumbnail_cache.get(source, width, height, timeout=current_app.config['THUMBNAIL_TIMEOUT'])
+    except (TimeoutError, OSError):
+        # Still rendering or not a readable image: the original is better than nothing
+        return original()
+
+    # The variant name is a hash of the source and the size, so it doubles as a strong ETag
+    etag = os.path.basename(path).rsplit('.', 1)[0]
+    accel_uri = current_app.config['THUMBNAIL_ACCEL_PREFIX'] + os.path.relpath(path, thumbnail_cache.folder).replace(os.sep, '/')
+    return send_upload(path, accel_uri, etag=etag, immutable=covers.is_content_addressed(filename))
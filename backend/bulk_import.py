@@ -0,0 +1,62 @@
+import csv
+import io
+import json
+
+
+REQUIRED_FIELDS = ('name', 'author', 'year_published', 'book_type')
+FORMATS = {'csv': 'csv', 'ndjson': 'ndjson', 'jsonl': 'ndjson', 'json': 'ndjson'}
+
+
+def detect_format(filename, requested=None):
+    name = (requested or filename.rsplit('.', 1)[-1]).lower()
+    if name not in FORMATS:
+        raise ValueError('Unsupported format, use csv or ndjson')
+    return FORMATS[name]
+
+
+def read_rows(stream, file_format):
+    # Yield (line number, row dict or None, error or None) one row at a time
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if file_format == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row, None
+    else:
+        for line_number, line in enumerate(text, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_number, None, f'Invalid JSON: {e}'
+                continue
+            if not isinstance(row, dict):
+                yield line_number, None, 'Each line must be a JSON object'
+                continue
+            yield line_number, row, None
+
+
+def validate_row(row):
+    # Return the Book column values of a row, or raise ValueError
+    missing = [field for field in REQUIRED_FIELDS if row.get(field) in (None, '')]
+    if missing:
+        raise ValueError('Missing ' + ', '.join(missing))
+
+    name = str(row['name']).strip()
+    author = str(row['author']).strip()
+    if len(name) > 100 or len(author) > 100:
+        raise ValueError('name and author must be at most 100 characters')
+    try:
+        year_published = int(row['year_published'])
+        book_type = int(row['book_type'])
+    except (TypeError, ValueError):
+        raise ValueError('year_published and book_type must be integers')
+
+    return {
+        'name': name,
+        'author': author,
+        'year_published': year_published,
+        'book_type': book_type,
+        'image_path': None,
+        'customer_id': None
+    }
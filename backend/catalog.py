@@ -0,0 +1,47 @@
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import Response, make_response, request
+
+from extensions import db, response_cache
+from models import CatalogVersion
+from response_cache import Entry
+
+
+def catalog_version():
+    return db.session.scalar(db.select(CatalogVersion.version).where(CatalogVersion.id == 1)) or 0
+
+
+def bump_catalog_version():
+    # Runs in the caller's transaction, so new data is never cached under the old version
+    db.session.execute(
+        db.update(CatalogVersion).where(CatalogVersion.id == 1).values(version=CatalogVersion.version + 1)
+    )
+
+
+def cached_response(func):
+    # Serve successful responses of a catalog read from response_cache, keyed
+    # by path, query string and catalog version. The ETag is derived from the
+    # same key, so a client whose copy is current gets a 304 without the
+    # handler or the cache being consulted.
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        version = catalog_version()
+        key = request.path + '?' + urlencode(sorted(request.args.items(multi=True)))
+        etag = response_cache.etag(key, version)
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            entry = response_cache.get(key, version)
+            if entry:
+                response = Response(entry.body, mimetype=entry.mimetype)
+            else:
+                response = make_response(func(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                response_cache.set(key, version, Entry(response.get_data(), response.mimetype))
+        response.set_etag(etag)
+        response.cache_control.no_cache = True  # Revalidate with If-None-Match on every use
+        return response
+
+    return wrapper
@@ -0,0 +1,75 @@
+import hashlib
+import os
+import re
+import tempfile
+
+
+CHUNK_SIZE = 64 * 1024
+NAME_PATTERN = re.compile(r'^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.\w+$')
+
+
+def cover_name(digest, extension):
+    # Two levels of two-hex-digit directories keep any one directory small:
+    # uploads/ab/cd/abcd...ef.jpg
+    return f'{digest[:2]}/{digest[2:4]}/{digest}.{extension}'
+
+
+def is_content_addressed(name):
+    # The bytes behind such a name never change, so clients may cache it forever
+    return NAME_PATTERN.match(name) is not None
+
+
+def spool(stream, upload_folder):
+    # Copy the stream to a temporary file in upload_folder chunk by chunk while
+    # hashing it. Returns (sha256 hex digest, temporary path).
+    os.makedirs(upload_folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=upload_folder, prefix='.upload-')
+    sha256 = hashlib.sha256()
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                sha256.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return sha256.hexdigest(), tmp_path
+
+
+def place(tmp_path, upload_folder, name):
+    # Move a spooled file to its content-addressed name, or drop it when the
+    # same bytes are already stored there
+    path = os.path.join(upload_folder, name)
+    if os.path.exists(path):
+        os.remove(tmp_path)
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.chmod(tmp_path, 0o644)  # mkstemp's 0600 would keep a front proxy from reading it
+        os.replace(tmp_path, path)
+
+
+def discard(tmp_path):
+    # Drop a spooled file that will not be placed
+    try:
+        os.remove(tmp_path)
+    except FileNotFoundError:
+        pass
+
+
+def hide(upload_folder, name):
+    # Move a stored file out of the way of its name. Returns the new path, or
+    # None when there was no file.
+    path = os.path.join(upload_folder, name)
+    try:
+        os.replace(path, path + '.deleted')
+    except FileNotFoundError:
+        return None
+    return path + '.deleted'
+
+
+def unhide(hidden, upload_folder, name):
+    if hidden:
+        os.replace(hidden, os.path.join(upload_folder, name))
@@ -0,0 +1,69 @@
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError
+
+
+def normalize_uri(uri):
+    # Some hosts hand out postgres:// URLs, which SQLAlchemy 2 no longer accepts
+    if uri.startswith('postgres://'):
+        return 'postgresql://' + uri[len('postgres://'):]
+    return uri
+
+
+def is_memory(url):
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def engine_options(uri, config):
+    # Keyword arguments for create_engine, built from the DB_POOL_* settings
+    options = {'pool_pre_ping': config['DB_POOL_PRE_PING']}
+    if not is_memory(make_url(uri)):
+        # An in-memory SQLite database lives in a single connection, so it has no pool to size
+        options.update(
+            pool_size=config['DB_POOL_SIZE'],
+            max_overflow=config['DB_MAX_OVERFLOW'],
+            pool_timeout=config['DB_POOL_TIMEOUT'],
+            pool_recycle=config['DB_POOL_RECYCLE'],
+        )
+    return options
+
+
+def sqlite_pragmas(config):
+    return [
+        ('journal_mode', config['SQLITE_JOURNAL_MODE']),
+        ('synchronous', config['SQLITE_SYNCHRONOUS']),
+        ('busy_timeout', int(config['SQLITE_BUSY_TIMEOUT'])),
+        ('mmap_size', int(config['SQLITE_MMAP_SIZE'])),
+        ('cache_size', int(config['SQLITE_CACHE_SIZE'])),
+    ]
+
+
+def tune_sqlite(engine, pragmas):
+    # Run the PRAGMAs on every new connection. Only journal_mode is stored in
+    # the database file; the others last as long as the connection does.
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas:
+            if value is not None:
+                cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+
+def dispose_after_fork(engine):
+    # A forked child (e.g. a gunicorn worker of a --preload parent) must not
+    # use the parent's pooled connections; it drops them without closing them
+    os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+
+
+def is_busy(error):
+    # True for the errors SQLite raises when busy_timeout ran out waiting for a lock
+    if not isinstance(error, OperationalError):
+        return False
+    message = str(error.orig)
+    return 'database is locked' in message or 'database table is locked' in message
@@ -0,0 +1,199 @@
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque, namedtuple
+
+from sqlalchemy import event as orm_event
+
+from extensions import db, event_relay
+from models import ChangeEvent
+from scheduler import Scheduler
+
+
+# `id` is the id of the change_event row, the same on every worker and
+# across restarts, so a client may resume from any of them
+Event = namedtuple('Event', ['id', 'type', 'data'])
+
+
+def format_event(event):
+    # The text/event-stream encoding of one event
+    return f'id: {event.id}\nevent: {event.type}\ndata: {event.data}\n\n'
+
+
+class Subscription:
+    # One connected client: a bounded queue of events published after it
+    # subscribed. A client that falls more than maxsize events behind is
+    # closed; it reconnects with Last-Event-ID and catches up from history.
+
+    def __init__(self, maxsize):
+        self.closed = False
+        self._queue = queue.Queue(maxsize)
+
+    def put(self, event):
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except queue.Full:
+            self.closed = True
+            return False
+
+    def get(self, timeout):
+        # The next event, or None after `timeout` seconds (at once when closed)
+        try:
+            return self._queue.get(block=not self.closed, timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+class EventBus:
+    # In-process publish/subscribe for change events, fed by EventRelay. The
+    # last `history` events are kept so that a client can resume after a
+    # reconnect. Each open stream holds a server thread, so beyond
+    # max_subscribers (None for no limit) subscribe() raises TooManySubscribers.
+
+    def __init__(self, history=1000, queue_size=100, max_subscribers=None):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._history = deque(maxlen=history)
+        self._reset()
+        # A worker forked from a preloaded parent loads its own history
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self.published = 0
+        self.refused = 0
+        self.newest = 0
+        self._history.clear()
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def load(self, events, newest):
+        # The history of a process that has just started, sent to no one
+        with self._lock:
+            self._history.extend(events)
+            self.newest = newest
+
+    def publish(self, event):
+        with self._lock:
+            self._history.append(event)
+            self.newest = max(self.newest, event.id)
+            self.published += 1
+            for subscription in list(self._subscribers):
+                if not subscription.put(event):
+                    self._subscribers.discard(subscription)
+        return event
+
+    def subscribe(self, last_event_id=None):
+        # A new Subscription and the events to send before anything from it:
+        # the ones after last_event_id, or a 'reset' event telling the client
+        # to reload everything when last_event_id is not in history any more.
+        # Events are matched by position, not by comparing ids: an event
+        # relayed late comes after events with higher ids.
+        subscription = Subscription(self.queue_size)
+        with self._lock:
+            if self.max_subscribers is not None and len(self._subscribers) >= self.max_subscribers:
+                self.refused += 1
+                raise TooManySubscribers()
+            backlog = []
+            if last_event_id:
+                seen = int(last_event_id) if last_event_id.isdigit() else None
+                ids = [event.id for event in self._history]
+                if seen in ids:
+                    backlog = list(self._history)[ids.index(seen) + 1:]
+                elif seen != self.newest:
+                    backlog = [Event(self.newest, 'reset', '{}')]
+            self._subscribers.add(subscription)
+        return subscription, backlog
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def stats(self):
+        with self._lock:
+            return {'published': self.published, 'subscribers': len(self._subscribers), 'refused': self.refused}
+
+
+class EventRelay:
+    # Hands the rows of change_event to this worker's EventBus, so that a
+    # client sees every change, whichever worker (or `flask overdue-worker`)
+    # made it. poll() publishes the rows committed since it last ran; it runs
+    # every `interval` seconds in a thread, and at once after a commit in this
+    # process. A PostgreSQL transaction takes its ids before it commits, so a
+    # row can show up after rows with higher ids: the ids skipped over are
+    # looked for again for GAP_SECONDS.
+
+    GAP_SECONDS = 60
+    MAX_GAP = 1000
+
+    def __init__(self, app, bus, history, interval):
+        self.app = app
+        self.bus = bus
+        self.history = history
+        self.scheduler = Scheduler(self.poll, interval, 'event-relay')
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self.last = None
+        self._pruned = 0
+        self._gaps = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        # The first poll loads the history, so a client can resume right away
+        if self.last is None:
+            self.poll()
+        self.scheduler.start()
+
+    def wake(self):
+        self.scheduler.wake()
+
+    def poll(self):
+        columns = (ChangeEvent.id, ChangeEvent.type, ChangeEvent.data)
+        with self._lock, self.app.app_context():
+            if self.last is None:
+                rows = db.session.execute(db.select(*columns).order_by(ChangeEvent.id.desc()).limit(self.history)).all()
+                self.last = self._pruned = rows[0].id if rows else 0
+                self.bus.load([Event(*row) for row in reversed(rows)], self.last)
+                return
+            since = min(self._gaps, default=self.last + 1)
+            rows = db.session.execute(db.select(*columns).where(ChangeEvent.id >= since).order_by(ChangeEvent.id)).all()
+            now = time.monotonic()
+            for row in rows:
+                if row.id > self.last:
+                    self._gaps.update(dict.fromkeys(range(max(self.last + 1, row.id - self.MAX_GAP), row.id), now))
+                    self.last = row.id
+                elif self._gaps.pop(row.id, None) is None:
+                    continue
+                self.bus.publish(Event(*row))
+            self._gaps = {gap: found for gap, found in self._gaps.items() if now - found < self.GAP_SECONDS}
+            if self.last - self._pruned >= self.history:
+                # Every worker prunes, keeping what a client may resume from
+                db.session.execute(db.delete(ChangeEvent).where(ChangeEvent.id <= self.last - self.history))
+                db.session.commit()
+                self._pruned = self.last
+
+
+def publish_after_commit(event_type, data):
+    # Write a change event in the current transaction; once it commits, the
+    # relay of every worker sends it to their /events subscribers
+    db.session.add(ChangeEvent(type=event_type, data=json.dumps(data, separators=(',', ':'))))
+    db.session.info['events'] = True
+
+
+@orm_event.listens_for(db.session, 'after_commit')
+def relay_committed_events(session):
+    if session.info.pop('events', False):
+        event_relay.wake()
+
+
+@orm_event.listens_for(db.session, 'after_rollback')
+def discard_events(session):
+    session.info.pop('events', None)
@@ -0,0 +1,60 @@
+import os
+
+import click
+from flask import current_app
+from flask.cli import ScriptInfo
+from flask_sqlalchemy import SQLAlchemy
+from werkzeug.local import LocalProxy
+
+
+db = SQLAlchemy()
+MIGRATIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+
+def service(name):
+    # The current app's instance of an object create_app() builds per app
+    return LocalProxy(lambda: current_app.extensions['library'][name])
+
+
+metrics = service('metrics')
+thumbnail_cache = service('thumbnail_cache')
+token_cache = service('token_cache')
+response_cache = service('response_cache')
+rate_limiter = service('rate_limiter')
+event_bus = service('event_bus')
+event_relay = service('event_relay')
+password_hasher = service('password_hasher')
+overdue_scheduler = service('overdue_scheduler')
+
+
+def init_migrations(app):
+    # Flask-Migrate imports alembic, which adds ~150 ms and ~10 MB to every
+    # worker, so it is only set up for `flask db` and upgrade_database()
+    if 'migrate' not in app.extensions:
+        from flask_migrate import Migrate
+        Migrate(app, db, directory=MIGRATIONS, render_as_batch=True)
+
+
+def upgrade_database(app):
+    init_migrations(app)
+    from flask_migrate import upgrade
+    with app.app_context():
+        upgrade()
+
+
+class MigrateCommands(click.Group):
+    # Stands in for Flask-Migrate's `flask db` group until a subcommand is used
+
+    def _commands(self, ctx):
+        init_migrations(ctx.ensure_object(ScriptInfo).load_app())
+        from flask_migrate.cli import db as commands
+        return commands
+
+    def list_commands(self, ctx):
+        return self._commands(ctx).list_commands(ctx)
+
+    def get_command(self, ctx, name):
+        return self._commands(ctx).get_command(ctx, name)
+
+
+migrate_commands = MigrateCommands('db', help='Perform database migrations.')
@@ -0,0 +1,113 @@
+import mimetypes
+import os
+import sys
+from datetime import datetime, timezone
+
+from werkzeug.http import http_date, is_resource_modified, parse_range_header, quote_etag
+from werkzeug.wsgi import ClosingIterator
+
+
+BLOCK_SIZE = 64 * 1024
+
+
+def offload_headers(offload, path, accel_uri):
+    # Headers handing the sending of a file to the front proxy: nginx maps
+    # accel_uri to the file through an internal location, Apache and
+    # lighttpd read path
+    if offload == 'x-accel':
+        return [('X-Accel-Redirect', accel_uri)]
+    if offload == 'x-sendfile':
+        return [('X-Sendfile', os.path.abspath(path))]
+    raise ValueError(f'Unknown offload mode {offload!r}, expected x-accel or x-sendfile')
+
+
+def file_chunks(file, length=sys.maxsize, block_size=BLOCK_SIZE):
+    # At most length bytes of file from its current position
+    while length > 0:
+        chunk = file.read(min(block_size, length))
+        if not chunk:
+            return
+        length -= len(chunk)
+        yield chunk
+
+
+class FileServer:
+    # WSGI middleware answering GET and HEAD for prefix + name straight from
+    # folder, ahead of Flask's routing, for the names match() accepts. Those
+    # names are content hashes, so the bytes behind them never change: the
+    # file stem is a strong ETag and clients may cache the file for max_age.
+    # Conditional requests get 304 and a single Range gets 206. The file is
+    # returned through the server's wsgi.file_wrapper, which gunicorn sends
+    # with sendfile() without copying it through Python. With offload set,
+    # the proxy is told to send the file instead. Anything else, including
+    # requests with a query string, goes on to the app.
+
+    def __init__(self, app, prefix, folder, match, max_age, offload=None, accel_prefix=None):
+        self.app = app
+        self.prefix = prefix
+        self.folder = folder
+        self.match = match
+        self.cache_control = f'public, max-age={max_age}, immutable'
+        self.offload = offload
+        self.accel_prefix = accel_prefix
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        name = path[len(self.prefix):]
+        if (environ['REQUEST_METHOD'] not in ('GET', 'HEAD') or environ.get('QUERY_STRING')
+                or not path.startswith(self.prefix) or not self.match(name)):
+            return self.app(environ, start_response)
+
+        file_path = os.path.join(self.folder, name)
+        headers = [
+            ('Content-Type', mimetypes.guess_type(name)[0] or 'application/octet-stream'),
+            ('Cache-Control', self.cache_control),
+            ('Access-Control-Allow-Origin', '*'),
+        ]
+        if self.offload:
+            start_response('200 OK', headers + offload_headers(self.offload, file_path, f'{self.accel_prefix}{name}'))
+            return []
+        try:
+            file = open(file_path, 'rb')
+        except OSError:
+            return self.app(environ, start_response)  # The app answers 404
+
+        try:
+            stat = os.fstat(file.fileno())
+            etag = os.path.basename(name).split('.', 1)[0]
+            modified = datetime.fromtimestamp(int(stat.st_mtime), timezone.utc)
+            headers += [('ETag', quote_etag(etag)), ('Last-Modified', http_date(modified)), ('Accept-Ranges', 'bytes')]
+            if not is_resource_modified(environ, etag=etag, last_modified=modified):
+                file.close()
+                start_response('304 Not Modified', headers)
+                return []
+
+            status, start, length = '200 OK', 0, stat.st_size
+            ranges = parse_range_header(environ.get('HTTP_RANGE'))
+            if_range = environ.get('HTTP_IF_RANGE')
+            if ranges is not None and (not if_range or if_range in (quote_etag(etag), http_date(modified))):
+                bounds = ranges.range_for_length(stat.st_size)
+                if bounds is not None:
+                    start, stop = bounds
+                    status, length = '206 Partial Content', stop - start
+                    headers.append(('Content-Range', f'bytes {start}-{stop - 1}/{stat.st_size}'))
+                elif len(ranges.ranges) == 1:
+                    file.close()
+                    start_response('416 Range Not Satisfiable', headers + [('Content-Range', f'bytes */{stat.st_size}')])
+                    return []
+                # Several ranges are answered with the whole file
+            headers.append(('Content-Length', str(length)))
+            file.seek(start)
+        except BaseException:
+            file.close()
+            raise
+
+        start_response(status, headers)
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            file.close()
+            return []
+        if 'wsgi.file_wrapper' in environ and start == 0:
+            # Not for a range that starts later: gunicorn's sendfile() always
+            # starts from the beginning of the file
+            return environ['wsgi.file_wrapper'](file, BLOCK_SIZE)
+        return ClosingIterator(file_chunks(file, length), file.close)
@@ -0,0 +1,23 @@
+# gunicorn -c gunicorn.conf.py
+# The app is imported once in the master and the workers are forked from it,
+# so they share its memory pages (copy-on-write) instead of each importing
+# Flask, SQLAlchemy and the app on its own.
+import gc
+import os
+
+
+wsgi_app = 'wsgi:app'
+preload_app = True
+bind = os.environ.get('GUNICORN_BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 2))
+worker_class = 'gthread'  # /events holds a thread per client
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+# Each /events stream holds a thread: leave the other half for the views
+os.environ.setdefault('FLASK_EVENTS_MAX_SUBSCRIBERS', str(max(1, threads // 2)))
+
+
+def pre_fork(server, worker):
+    # Move everything allocated so far out of the collector's reach: a
+    # collection touches every object's header, which would copy the shared
+    # pages into each worker
+    gc.freeze()
@@ -0,0 +1,461 @@
+import heapq
+import logging
+import time
+from datetime import datetime, timedelta
+from itertools import islice
+
+import click
+from flask import Blueprint, Response, current_app, g, jsonify, request, stream_with_context
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+from auth import login_required
+from catalog import bump_catalog_version
+from events import publish_after_commit
+from extensions import db, overdue_scheduler
+from models import Book, Loan, LoanArchive, LoanPolicy, OverdueLoan, OverdueWatermark
+from pagination import decode_cursor, keyset_page, merge_keyset_pages, parse_limit
+from serializers import COMPACT, RowSerializer, format_date, legacy_dates, strftime
+from stats import UNKNOWN_BOOK_TYPE, count_loans, count_returns
+
+
+bp = Blueprint('loans', __name__, cli_group=None)
+
+# Dates are ISO-8601 unless JSON_LEGACY_DATES asks for these older formats
+LOAN_DATE_FORMAT = '%d-%m-%Y %H:%M:%S'
+LATE_RETURN_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+# Rows of the GET /loans query, in its column order
+loan_rows = RowSerializer(
+    ['id', 'customer_id', 'book_id', 'loan_date', 'return_date', 'expected_return_date'],
+    legacy={field: strftime(LOAN_DATE_FORMAT) for field in ['loan_date', 'return_date', 'expected_return_date']}
+)
+
+
+def wants_stream():
+    if request.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return request.accept_mimetypes.best == 'application/x-ndjson'
+
+
+def loan_query(model):
+    # One joined statement per page instead of a Book lookup per loan
+    return db.select(
+        model.id, model.customer_id, model.book_id, model.loan_date, model.return_date,
+        model.due_date.label('expected_return_date')
+    ).join(Book, Book.id == model.book_id)
+
+
+def stream_loans(models, after):
+    # Rows are fetched from a server-side cursor per table in batches of
+    # STREAM_BATCH_SIZE, merged in id order and written out one batch at a
+    # time, so memory does not grow with the history
+    batch_size = current_app.config['STREAM_BATCH_SIZE']
+    results = []
+    for model in models:
+        query = loan_query(model)
+        if after is not None:
+            query = query.where(model.id > after)
+        results.append(db.session.execute(query.order_by(model.id).execution_options(yield_per=batch_size)))
+    rows = heapq.merge(*results, key=lambda row: row.id)
+    legacy = legacy_dates()
+    # Legacy output keeps the spaced separators of json.dumps
+    dump_args = {} if legacy else COMPACT
+    while batch := list(islice(rows, batch_size)):
+        yield ''.join(current_app.json.dumps(loan, **dump_args) + '\n' for loan in loan_rows(batch, legacy))
+
+
+@bp.route('/loans', methods=['GET'])
+def get_loans():
+    try:
+        limit = parse_limit(request.args.get('limit'))
+        after = decode_cursor(request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Open and recent loans by default; with ?history=1 also the loans moved
+    # to loan_archive, which keep their ids, so one cursor pages through both
+    models = [Loan]
+    if request.args.get('history', '').lower() in ('1', 'true', 'yes'):
+        models.append(LoanArchive)
+
+    try:
+        # Full history export, one JSON object per line
+        if wants_stream():
+            return Response(stream_with_context(stream_loans(models, after)), mimetype='application/x-ndjson')
+
+        rows, next_cursor = merge_keyset_pages([keyset_page(loan_query(model), model.id, limit, after) for model in models], limit)
+        loan_info = loan_rows(rows, legacy_dates())
+
+        return jsonify({'loans': loan_info, 'next': next_cursor}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+
+
+def checkout_books(user_id, book_ids, loan_date):
+    # Loan every free book of book_ids to the user: one UPDATE claims the free
+    # books (the WHERE clause makes the availability check and the write a
+    # single step, so concurrent requests cannot both win) and one INSERT
+    # creates their loans. Returns {book_id: (status, due_date)} with status
+    # 'loaned', 'already_loaned' or 'not_found'. The caller commits.
+    claimed = db.session.execute(
+        db.update(Book)
+        .where(Book.id.in_(book_ids), Book.customer_id.is_(None))
+        .values(customer_id=user_id)
+        .returning(Book.id, Book.book_type)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+    results = {}
+    if claimed:
+        periods = {policy.book_type: timedelta(days=policy.max_days) for policy in LoanPolicy.query.all()}
+        loans = []
+        for book in claimed:
+            due_date = loan_date + periods.get(book.book_type, timedelta(days=0))
+            loans.append({'book_id': book.id, 'customer_id': user_id, 'loan_date': loan_date, 'due_date': due_date})
+            results[book.id] = ('loaned', due_date)
+        loan_ids = dict(db.session.execute(db.insert(Loan).returning(Loan.book_id, Loan.id), loans).all())
+        count_loans(user_id, loan_date, [(book.id, book.book_type) for book in claimed])
+        bump_catalog_version()
+        for loan in loans:
+            publish_after_commit('book.loaned', {
+                'id': loan_ids[loan['book_id']],
+                'book_id': loan['book_id'],
+                'customer_id': user_id,
+                'loan_date': format_date(loan_date, LOAN_DATE_FORMAT),
+                'return_date': None,
+                'expected_return_date': format_date(loan['due_date'], LOAN_DATE_FORMAT)
+            })
+
+    missing = [book_id for book_id in book_ids if book_id not in results]
+    if missing:
+        existing = set(db.session.scalars(db.select(Book.id).where(Book.id.in_(missing))))
+        for book_id in missing:
+            results[book_id] = ('already_loaned' if book_id in existing else 'not_found', None)
+    return results
+
+
+def checkin_books(user_id, book_ids, return_date):
+    # Return the user's books of book_ids: one UPDATE closes their open loans
+    # and one releases the books. Returns {book_id: (status, late)} with status
+    # 'returned', 'not_found', 'not_holder' or 'no_loan'. The caller commits.
+    closed = db.session.execute(
+        db.update(Loan)
+        .where(Loan.book_id.in_(book_ids), Loan.customer_id == user_id, Loan.return_date.is_(None))
+        .values(return_date=return_date)
+        .returning(Loan.id, Loan.book_id, Loan.due_date)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+    results = {}
+    if closed:
+        book_types = dict(db.session.execute(
+            db.update(Book)
+            .where(Book.id.in_([loan.book_id for loan in closed]), Book.customer_id == user_id)
+            .values(customer_id=None)
+            .returning(Book.id, Book.book_type)
+            .execution_options(synchronize_session=False)
+        ).all())
+        bump_catalog_version()
+        for loan in closed:
+            # Late when returned after the due date stored on the loan
+            late = bool(loan.due_date and return_date > loan.due_date)
+            results[loan.book_id] = ('returned', late)
+            publish_after_commit('book.returned', {
+                'id': loan.id,
+                'book_id': loan.book_id,
+                'customer_id': user_id,
+                'return_date': format_date(return_date, LOAN_DATE_FORMAT),
+                'late': late
+            })
+        count_returns(user_id, return_date, [(book_types.get(loan.book_id, UNKNOWN_BOOK_TYPE), results[loan.book_id][1]) for loan in closed])
+        late_ids = [loan.id for loan in closed if results[loan.book_id][1]]
+        if late_ids:
+            db.session.execute(db.delete(OverdueLoan).where(OverdueLoan.loan_id.in_(late_ids)))
+
+    missing = [book_id for book_id in book_ids if book_id not in results]
+    if missing:
+        holders = dict(db.session.execute(db.select(Book.id, Book.customer_id).where(Book.id.in_(missing))).all())
+        for book_id in missing:
+            if book_id not in holders:
+                results[book_id] = ('not_found', False)
+            elif holders[book_id] != user_id:
+                results[book_id] = ('not_holder', False)
+            else:
+                results[book_id] = ('no_loan', False)
+    return results
+
+
+LOAN_MESSAGES = {
+    'loaned': ('Book loaned successfully', 200),
+    'already_loaned': ('Book is already loaned', 400),
+    'not_found': ('Book not found', 404),
+}
+
+RETURN_MESSAGES = {
+    'returned': ('Book returned successfully', 200),
+    'not_found': ('Book not found', 404),
+    'not_holder': ('You are not authorized to return this book', 403),
+    'no_loan': ('Loan record not found for this book', 404),
+}
+
+
+@bp.route('/books/<int:book_id>/loan', methods=['POST'])
+@login_required 
+def loan_book(book_id):
+    try:
+        status, _ = checkout_books(g.user.id, [book_id], datetime.utcnow())[book_id]
+        db.session.commit()
+    except IntegrityError:
+        # uq_loan_open_book: another open loan exists for this book
+        db.session.rollback()
+        status = 'already_loaned'
+
+    message, code = LOAN_MESSAGES[status]
+    return jsonify({'message': message}), code
+
+
+
+
+
+
+@bp.route('/books/<int:book_id>/return', methods=['POST'])
+@login_required 
+def return_book(book_id):
+    status, late = checkin_books(g.user.id, [book_id], datetime.utcnow())[book_id]
+    db.session.commit()
+
+    # Check if the return is late
+    if late:
+        return jsonify({'message': 'Book returned successfully, but it is late!'}), 200
+
+    message, code = RETURN_MESSAGES[status]
+    return jsonify({'message': message}), code
+
+
+def parse_book_ids():
+    data = request.get_json(silent=True) or {}
+    book_ids = data.get('book_ids')
+    if not isinstance(book_ids, list) or not book_ids:
+        raise ValueError('book_ids must be a non-empty list')
+    if not all(isinstance(book_id, int) and not isinstance(book_id, bool) for book_id in book_ids):
+        raise ValueError('book_ids must be integers')
+    book_ids = list(dict.fromkeys(book_ids))
+    if len(book_ids) > current_app.config['BATCH_MAX_BOOKS']:
+        raise ValueError(f"At most {current_app.config['BATCH_MAX_BOOKS']} books per batch")
+    return book_ids
+
+
+@bp.route('/loans/batch', methods=['POST'])
+@login_required
+def loan_books_batch():
+    try:
+        book_ids = parse_book_ids()
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+    try:
+        results = checkout_books(g.user.id, book_ids, datetime.utcnow())
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'message': 'Some of the books were loaned concurrently, please retry'}), 409
+
+    items = []
+    for book_id in book_ids:
+        status, due_date = results[book_id]
+        items.append({
+            'book_id': book_id,
+            'success': status == 'loaned',
+            'message': LOAN_MESSAGES[status][0],
+            'expected_return_date': format_date(due_date, LOAN_DATE_FORMAT)
+        })
+    return jsonify({'results': items}), 200
+
+
+@bp.route('/returns/batch', methods=['POST'])
+@login_required
+def return_books_batch():
+    try:
+        book_ids = parse_book_ids()
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+    results = checkin_books(g.user.id, book_ids, datetime.utcnow())
+    db.session.commit()
+
+    items = []
+    for book_id in book_ids:
+        status, late = results[book_id]
+        items.append({
+            'book_id': book_id,
+            'success': status == 'returned',
+            'message': 'Book returned successfully, but it is late!' if late else RETURN_MESSAGES[status][0],
+            'late': late
+        })
+    return jsonify({'results': items}), 200
+
+
+@bp.route('/books/return', methods=['GET'])
+def display_late_returns():
+    try:
+        limit = parse_limit(request.args.get('limit'))
+        after = decode_cursor(request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Read from the overdue_loan table kept by the overdue scheduler
+    query = db.select(
+        OverdueLoan.loan_id.label('id'), Book.name.label('book_name'), OverdueLoan.loan_date, OverdueLoan.customer_id,
+        OverdueLoan.due_date.label('expected_return_date')
+    ).join(Book, Book.id == OverdueLoan.book_id)
+    rows, next_cursor = keyset_page(query, OverdueLoan.loan_id, limit, after)
+
+    late_returns = late_return_rows(rows, legacy_dates())
+    return jsonify({'late_returns': late_returns, 'next': next_cursor}), 200
+
+
+late_return_rows = RowSerializer(
+    ['id', 'book_name', 'loan_date', 'expected_return_date', 'customer_id'],
+    columns=['id', 'book_name', 'loan_date', 'customer_id', 'expected_return_date'],
+    legacy={field: strftime(LATE_RETURN_DATE_FORMAT) for field in ['loan_date', 'expected_return_date']}
+)
+
+
+# Gauges from the latest overdue scan
+overdue_stats = {'overdue_loans': 0, 'marked_total': 0, 'scans': 0, 'last_scan_at': None, 'last_scan_seconds': 0.0}
+
+
+def mark_overdue_loans(now):
+    # Copy the open loans that fell due since the last scan into overdue_loan
+    # and publish a loan.overdue event for each. Only the due_date range from
+    # the watermark (minus OVERDUE_SCAN_OVERLAP, for loans committed while the
+    # previous scan ran) up to now is read from ix_loan_return_date_due_date.
+    # Returns the number of loans marked.
+    watermark = db.session.get(OverdueWatermark, 1)
+    # Joined to book: a loan whose book is gone cannot go into overdue_loan
+    due = db.select(Loan.id, Loan.book_id, Loan.customer_id, Loan.loan_date, Loan.due_date).join(
+        Book, Book.id == Loan.book_id
+    ).where(
+        Loan.return_date.is_(None),
+        Loan.due_date < now,
+        ~db.exists().where(OverdueLoan.loan_id == Loan.id)
+    )
+    if watermark.marked_until is not None:
+        due = due.where(Loan.due_date >= watermark.marked_until - timedelta(seconds=current_app.config['OVERDUE_SCAN_OVERLAP']))
+    # Loans another worker is marking at the same time are skipped, not an error
+    dialect = postgresql if db.session.get_bind().dialect.name == 'postgresql' else sqlite
+    marked = db.session.execute(
+        dialect.insert(OverdueLoan)
+        .from_select(['loan_id', 'book_id', 'customer_id', 'loan_date', 'due_date'], due)
+        .on_conflict_do_nothing(index_elements=['loan_id'])
+        .returning(OverdueLoan.loan_id, OverdueLoan.book_id, OverdueLoan.customer_id, OverdueLoan.loan_date, OverdueLoan.due_date)
+    ).all()
+    watermark.marked_until = now
+
+    if marked:
+        names = dict(db.session.execute(db.select(Book.id, Book.name).where(Book.id.in_({loan.book_id for loan in marked}))).all())
+        for loan in marked:
+            publish_after_commit('loan.overdue', {
+                'id': loan.loan_id,
+                'book_id': loan.book_id,
+                'book_name': names.get(loan.book_id),
+                'customer_id': loan.customer_id,
+                'loan_date': format_date(loan.loan_date, LATE_RETURN_DATE_FORMAT),
+                'expected_return_date': format_date(loan.due_date, LATE_RETURN_DATE_FORMAT)
+            })
+    db.session.commit()
+    return len(marked)
+
+
+def scan_overdue_loans(app):
+    # One scheduler run. Returns the seconds until the next open loan falls due.
+    with app.app_context():
+        started = time.perf_counter()
+        now = datetime.utcnow()
+        try:
+            marked = mark_overdue_loans(now)
+        except IntegrityError:
+            # Not a race (those are skipped): a row overdue_loan cannot take.
+            # Logged, so that it does not silently stop every later scan.
+            db.session.rollback()
+            app.logger.exception('Overdue scan failed')
+            marked = 0
+        next_due = db.session.scalar(
+            db.select(db.func.min(Loan.due_date)).where(Loan.return_date.is_(None), Loan.due_date >= now)
+        )
+        overdue_stats['overdue_loans'] = db.session.scalar(db.select(db.func.count()).select_from(OverdueLoan))
+        overdue_stats['marked_total'] += marked
+        overdue_stats['scans'] += 1
+        overdue_stats['last_scan_at'] = now
+        overdue_stats['last_scan_seconds'] = time.perf_counter() - started
+        if marked:
+            app.logger.info('Marked %d loans overdue, %d overdue in total', marked, overdue_stats['overdue_loans'])
+        return (next_due - now).total_seconds() if next_due else None
+
+
+@bp.before_app_request
+def start_overdue_scheduler():
+    # Started lazily so that CLI commands and the parent of forked workers do not run it
+    if current_app.config['OVERDUE_SCHEDULER'] == 'thread':
+        overdue_scheduler.start()
+
+
+@bp.cli.command('overdue-worker')
+@click.option('--once', is_flag=True, help='Scan once and exit, e.g. from cron.')
+def overdue_worker_command(once):
+    """Mark loans overdue as they fall due, in place of the in-process scheduler."""
+    if once:
+        scan_overdue_loans(current_app._get_current_object())
+        click.echo(f"Marked {overdue_stats['marked_total']} loans overdue, {overdue_stats['overdue_loans']} overdue in total")
+        return
+    logging.basicConfig(level=logging.INFO)
+    current_app.logger.setLevel(logging.INFO)
+    overdue_scheduler.run_forever()
+
+
+def archive_loans(before, batch_size, pause=0):
+    # Move loans returned before `before` from loan to loan_archive,
+    # batch_size at a time, each batch in its own short transaction so
+    # checkouts and returns only ever wait for one batch. The loan with the
+    # highest id stays, so SQLite never hands its id out again. Returns the
+    # number of loans moved.
+    moved = 0
+    while True:
+        ids = db.session.scalars(
+            db.select(Loan.id)
+            .where(
+                Loan.return_date < before,
+                Loan.id < db.select(db.func.max(Loan.id)).scalar_subquery(),
+                ~db.exists().where(OverdueLoan.loan_id == Loan.id)
+            )
+            .order_by(Loan.return_date)
+            .limit(batch_size)
+        ).all()
+        if not ids:
+            return moved
+        db.session.execute(db.insert(LoanArchive).from_select(
+            ['id', 'customer_id', 'book_id', 'loan_date', 'return_date', 'due_date'],
+            db.select(Loan.id, Loan.customer_id, Loan.book_id, Loan.loan_date, Loan.return_date, Loan.due_date)
+            .where(Loan.id.in_(ids))
+        ))
+        db.session.execute(db.delete(Loan).where(Loan.id.in_(ids)).execution_options(synchronize_session=False))
+        db.session.commit()
+        moved += len(ids)
+        if len(ids) < batch_size:
+            return moved
+        time.sleep(pause)
+
+
+@bp.cli.command('archive-loans')
+@click.option('--days', type=int, help='Archive loans returned more than this many days ago [LOAN_ARCHIVE_DAYS].')
+@click.option('--batch-size', type=int, help='Loans moved per transaction [LOAN_ARCHIVE_BATCH_SIZE].')
+def archive_loans_command(days, batch_size):
+    """Move old returned loans to loan_archive, e.g. nightly from cron."""
+    config = current_app.config
+    days = config['LOAN_ARCHIVE_DAYS'] if days is None else days
+    before = datetime.utcnow() - timedelta(days=days)
+    moved = archive_loans(before, batch_size or config['LOAN_ARCHIVE_BATCH_SIZE'], config['LOAN_ARCHIVE_PAUSE'])
+    click.echo(f'Archived {moved} loans returned before {before:%Y-%m-%d %H:%M}')
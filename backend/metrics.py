@@ -0,0 +1,153 @@
+import bisect
+import contextvars
+import logging
+import threading
+import time
+
+from sqlalchemy import event
+
+
+logger = logging.getLogger('library.slow_query')
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# [statements, seconds] spent in the database by the current request, or None outside one
+_request_queries = contextvars.ContextVar('request_queries', default=None)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels=''):
+        lines = []
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            lines.append(f'{name}_bucket{{{labels}{"," if labels else ""}le="{bound}"}} {total}')
+        suffix = f'{{{labels}}}' if labels else ''
+        lines.append(f'{name}_sum{suffix} {self.sum}')
+        lines.append(f'{name}_count{suffix} {self.count}')
+        return lines
+
+
+def quote(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics:
+    # Request and query statistics of this process, in the Prometheus text
+    # format. Every gunicorn worker keeps its own; scrape each or sum them.
+
+    def __init__(self, prefix='library', slow_query_seconds=0.1):
+        self.prefix = prefix
+        self.slow_query_seconds = slow_query_seconds
+        self.latency = {}
+        self.statements = {}
+        self.requests = {}
+        self.db_statements = {}
+        self.db_seconds = {}
+        self.query_latency = Histogram(LATENCY_BUCKETS)
+        self.slow_queries = 0
+        self._lock = threading.Lock()
+
+    def install(self, engine):
+        # Time every statement run on `engine`. The start time lives on the
+        # statement's execution context, which goes away with it: one that
+        # raises never reaches after_cursor_execute, and anything kept on the
+        # connection would be left behind for the pool's next user.
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            context._query_started = time.perf_counter()
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            self.observe_query(time.perf_counter() - context._query_started, statement, parameters)
+
+    def observe_query(self, seconds, statement, parameters):
+        current = _request_queries.get()
+        if current is not None:
+            current[0] += 1
+            current[1] += seconds
+        with self._lock:
+            self.query_latency.observe(seconds)
+            if seconds >= self.slow_query_seconds:
+                self.slow_queries += 1
+        if seconds >= self.slow_query_seconds:
+            parameters = repr(parameters)
+            if len(parameters) > 1000:
+                parameters = parameters[:1000] + '...'
+            logger.warning('Slow query (%.1f ms): %s with %s', seconds * 1000, statement, parameters)
+
+    def start_request(self):
+        # Returns a token for finish_request()
+        return time.perf_counter(), _request_queries.set([0, 0.0])
+
+    def finish_request(self, started, endpoint, method, status):
+        # Record the request; returns (seconds, statements, db seconds)
+        started_at, token = started
+        seconds = time.perf_counter() - started_at
+        statements, db_seconds = _request_queries.get()
+        _request_queries.reset(token)
+        key = (endpoint, method)
+        with self._lock:
+            if key not in self.latency:
+                self.latency[key] = Histogram(LATENCY_BUCKETS)
+                self.statements[key] = Histogram(STATEMENT_BUCKETS)
+                self.db_statements[key] = 0
+                self.db_seconds[key] = 0.0
+            self.latency[key].observe(seconds)
+            self.statements[key].observe(statements)
+            self.db_statements[key] += statements
+            self.db_seconds[key] += db_seconds
+            self.requests[key + (status,)] = self.requests.get(key + (status,), 0) + 1
+        return seconds, statements, db_seconds
+
+    def render(self, extra=()):
+        # extra: (name, type, help, value) read by the caller at scrape time
+        p = self.prefix
+        lines = []
+
+        def header(name, kind, text):
+            lines.append(f'# HELP {p}_{name} {text}')
+            lines.append(f'# TYPE {p}_{name} {kind}')
+
+        with self._lock:
+            header('http_requests_total', 'counter', 'Requests by endpoint, method and status.')
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append(f'{p}_http_requests_total{{endpoint="{quote(endpoint)}",method="{method}",status="{status}"}} {count}')
+            header('http_request_duration_seconds', 'histogram', 'Time to produce the response headers.')
+            for (endpoint, method), histogram in sorted(self.latency.items()):
+                lines.extend(histogram.render(f'{p}_http_request_duration_seconds', f'endpoint="{quote(endpoint)}",method="{method}"'))
+            header('db_statements_per_request', 'histogram', 'SQL statements run by one request.')
+            for (endpoint, method), histogram in sorted(self.statements.items()):
+                lines.extend(histogram.render(f'{p}_db_statements_per_request', f'endpoint="{quote(endpoint)}",method="{method}"'))
+            header('db_statements_total', 'counter', 'SQL statements run by requests.')
+            for (endpoint, method), count in sorted(self.db_statements.items()):
+                lines.append(f'{p}_db_statements_total{{endpoint="{quote(endpoint)}",method="{method}"}} {count}')
+            header('db_seconds_total', 'counter', 'Time requests spent in SQL statements.')
+            for (endpoint, method), seconds in sorted(self.db_seconds.items()):
+                lines.append(f'{p}_db_seconds_total{{endpoint="{quote(endpoint)}",method="{method}"}} {seconds}')
+            header('db_query_duration_seconds', 'histogram', 'Duration of every SQL statement, in requests or not.')
+            lines.extend(self.query_latency.render(f'{p}_db_query_duration_seconds'))
+            header('db_slow_queries_total', 'counter', 'SQL statements slower than the slow query threshold.')
+            lines.append(f'{p}_db_slow_queries_total {self.slow_queries}')
+
+        for name, kind, text, value in extra:
+            header(name, kind, text)
+            lines.append(f'{p}_{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def server_timing(seconds, statements, db_seconds):
+    # Value of the Server-Timing header
+    return f'db;dur={db_seconds * 1000:.1f};desc="{statements} statements", total;dur={seconds * 1000:.1f}'
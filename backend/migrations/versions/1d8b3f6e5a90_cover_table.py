@@ -0,0 +1,29 @@
+"""content-addressed cover table
+
+Revision ID: 1d8b3f6e5a90
+Revises: e27a5d0b84c6
+Create Date: 2026-10-17 12:20:48.310275
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1d8b3f6e5a90'
+down_revision = 'e27a5d0b84c6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('cover',
+    sa.Column('digest', sa.String(length=64), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('refcount', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('digest')
+    )
+
+
+def downgrade():
+    op.drop_table('cover')
@@ -0,0 +1,64 @@
+"""initial schema
+
+Revision ID: 5b0f6d3c2a41
+Revises: 
+Create Date: 2026-10-17 09:12:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b0f6d3c2a41'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases created with db.create_all() before migrations were introduced
+    # already have these tables, so only create the ones that are missing
+    existing = sa.inspect(op.get_bind()).get_table_names()
+
+    if 'user' not in existing:
+        op.create_table('user',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('city', sa.String(length=50), nullable=False),
+        sa.Column('age', sa.Integer(), nullable=True),
+        sa.Column('username', sa.String(length=50), nullable=False),
+        sa.Column('password', sa.String(length=50), nullable=False),
+        sa.Column('is_admin', sa.Boolean(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('username')
+        )
+    if 'book' not in existing:
+        op.create_table('book',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('author', sa.String(length=100), nullable=False),
+        sa.Column('year_published', sa.Integer(), nullable=False),
+        sa.Column('book_type', sa.Integer(), nullable=False),
+        sa.Column('image_path', sa.String(length=100), nullable=True),
+        sa.Column('customer_id', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['customer_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+    if 'loan' not in existing:
+        op.create_table('loan',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('customer_id', sa.Integer(), nullable=True),
+        sa.Column('book_id', sa.Integer(), nullable=True),
+        sa.Column('loan_date', sa.DateTime(), nullable=True),
+        sa.Column('return_date', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['book_id'], ['book.id'], ),
+        sa.ForeignKeyConstraint(['customer_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+
+
+def downgrade():
+    op.drop_table('loan')
+    op.drop_table('book')
+    op.drop_table('user')
@@ -0,0 +1,53 @@
+"""full-text search indexes for books and users
+
+Revision ID: 7f2c9e4b1a63
+Revises: 1d8b3f6e5a90
+Create Date: 2026-10-17 13:48:02.671094
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7f2c9e4b1a63'
+down_revision = '1d8b3f6e5a90'
+branch_labels = None
+depends_on = None
+
+
+# (index, table, indexed columns)
+INDEXES = [
+    ('book_search', 'book', ['name', 'author']),
+    ('user_search', 'user', ['name', 'city']),
+]
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        # FTS5 is SQLite only; other databases are searched with ILIKE (see search.py)
+        return
+    for index, table, columns in INDEXES:
+        column_list = ', '.join(columns)
+        new_values = ', '.join(f'new.{column}' for column in columns)
+        old_values = ', '.join(f'old.{column}' for column in columns)
+        insert = f'INSERT INTO {index}(rowid, {column_list}) VALUES (new.id, {new_values});'
+        delete = f"INSERT INTO {index}({index}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});"
+
+        # External-content FTS5 table: it stores only the index, the text stays in the table
+        op.execute(f"CREATE VIRTUAL TABLE {index} USING fts5({column_list}, content='{table}', content_rowid='id', tokenize='trigram')")
+        op.execute(f'CREATE TRIGGER {index}_insert AFTER INSERT ON "{table}" BEGIN {insert} END')
+        op.execute(f'CREATE TRIGGER {index}_delete AFTER DELETE ON "{table}" BEGIN {delete} END')
+        op.execute(f'CREATE TRIGGER {index}_update AFTER UPDATE OF {column_list} ON "{table}" BEGIN {delete} {insert} END')
+        # Index the rows that already exist
+        op.execute(f"INSERT INTO {index}({index}) VALUES ('rebuild')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for index, _, _ in INDEXES:
+        op.execute(f'DROP TRIGGER {index}_update')
+        op.execute(f'DROP TRIGGER {index}_delete')
+        op.execute(f'DROP TRIGGER {index}_insert')
+        op.execute(f'DROP TABLE {index}')
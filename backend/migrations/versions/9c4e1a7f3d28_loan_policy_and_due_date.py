@@ -0,0 +1,70 @@
+"""loan policy table, persisted due date and loan indexes
+
+Revision ID: 9c4e1a7f3d28
+Revises: 5b0f6d3c2a41
+Create Date: 2026-10-17 09:31:05.442317
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c4e1a7f3d28'
+down_revision = '5b0f6d3c2a41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    loan_policy = op.create_table('loan_policy',
+    sa.Column('book_type', sa.Integer(), nullable=False),
+    sa.Column('max_days', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('book_type')
+    )
+    # The loan periods that used to be hard-coded in app.py
+    op.bulk_insert(loan_policy, [
+        {'book_type': 1, 'max_days': 10},
+        {'book_type': 2, 'max_days': 5},
+        {'book_type': 3, 'max_days': 2},
+    ])
+
+    with op.batch_alter_table('loan', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('due_date', sa.DateTime(), nullable=True))
+
+    # Backfill existing loans; books without a policy get a zero-day period as before
+    max_days = """coalesce((
+        SELECT loan_policy.max_days FROM book
+        JOIN loan_policy ON loan_policy.book_type = book.book_type
+        WHERE book.id = loan.book_id
+    ), 0)"""
+    if op.get_bind().dialect.name == 'postgresql':
+        due_date = f'loan_date + make_interval(days => {max_days})'
+    else:
+        due_date = f"datetime(loan_date, '+' || {max_days} || ' days')"
+    op.execute(f'UPDATE loan SET due_date = {due_date} WHERE loan_date IS NOT NULL')
+
+    with op.batch_alter_table('loan', schema=None) as batch_op:
+        batch_op.create_index('ix_loan_return_date_due_date', ['return_date', 'due_date'], unique=False)
+        batch_op.create_index('ix_loan_book_id_customer_id_return_date', ['book_id', 'customer_id', 'return_date'], unique=False)
+
+    with op.batch_alter_table('book', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_book_name'), ['name'], unique=False)
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_user_name'), ['name'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_user_name'))
+
+    with op.batch_alter_table('book', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_book_name'))
+
+    with op.batch_alter_table('loan', schema=None) as batch_op:
+        batch_op.drop_index('ix_loan_book_id_customer_id_return_date')
+        batch_op.drop_index('ix_loan_return_date_due_date')
+        batch_op.drop_column('due_date')
+
+    op.drop_table('loan_policy')
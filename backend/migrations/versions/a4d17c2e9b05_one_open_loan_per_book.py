@@ -0,0 +1,47 @@
+"""at most one open loan per book
+
+Revision ID: a4d17c2e9b05
+Revises: 7f2c9e4b1a63
+Create Date: 2026-10-18 09:05:33.218640
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d17c2e9b05'
+down_revision = '7f2c9e4b1a63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Open loans the index would reject, left by the old check-then-write race
+    # and by deleting a user or a book that was out. Loans of deleted users
+    # or books are closed (the books were already freed). Of several open
+    # loans of one book the newest stays open, and the book goes to its
+    # borrower.
+    op.execute("UPDATE loan SET return_date = CURRENT_TIMESTAMP WHERE return_date IS NULL AND (customer_id IS NULL OR book_id IS NULL)")
+    op.execute("""
+        UPDATE book SET customer_id = (
+            SELECT newest.customer_id FROM loan AS newest
+            WHERE newest.id = (SELECT max(other.id) FROM loan AS other WHERE other.book_id = book.id AND other.return_date IS NULL)
+        )
+        WHERE id IN (SELECT book_id FROM loan WHERE return_date IS NULL GROUP BY book_id HAVING count(*) > 1)
+    """)
+    op.execute("""
+        UPDATE loan SET return_date = CURRENT_TIMESTAMP
+        WHERE return_date IS NULL
+          AND id < (SELECT max(other.id) FROM loan AS other WHERE other.book_id = loan.book_id AND other.return_date IS NULL)
+    """)
+
+    with op.batch_alter_table('loan', schema=None) as batch_op:
+        batch_op.create_index('uq_loan_open_book', ['book_id'], unique=True,
+                              sqlite_where=sa.text('return_date IS NULL'), postgresql_where=sa.text('return_date IS NULL'))
+
+
+def downgrade():
+    with op.batch_alter_table('loan', schema=None) as batch_op:
+        batch_op.drop_index('uq_loan_open_book',
+                            sqlite_where=sa.text('return_date IS NULL'), postgresql_where=sa.text('return_date IS NULL'))
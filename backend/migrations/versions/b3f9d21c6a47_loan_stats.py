@@ -0,0 +1,64 @@
+"""loan stats aggregates for /stats
+
+Revision ID: b3f9d21c6a47
+Revises: e5b29a7c3f18
+Create Date: 2026-10-18 14:26:03.417952
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3f9d21c6a47'
+down_revision = 'e5b29a7c3f18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('loan_stats',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('book_type', sa.Integer(), nullable=False),
+    sa.Column('city', sa.String(length=50), nullable=False),
+    sa.Column('loans', sa.Integer(), nullable=False),
+    sa.Column('returns', sa.Integer(), nullable=False),
+    sa.Column('late_returns', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'book_type', 'city')
+    )
+    op.create_table('book_loan_count',
+    sa.Column('book_id', sa.Integer(), nullable=False),
+    sa.Column('loans', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('book_id')
+    )
+    with op.batch_alter_table('book_loan_count', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_book_loan_count_loans'), ['loans'], unique=False)
+
+    # Count the existing history, as `flask stats rebuild` does
+    op.execute("""
+        INSERT INTO loan_stats (day, book_type, city, loans, returns, late_returns)
+        SELECT day, book_type, city, sum(loans), sum(returns), sum(late_returns) FROM (
+            SELECT date(loan.loan_date) AS day, coalesce(book.book_type, 0) AS book_type, coalesce("user".city, '') AS city,
+                   1 AS loans, 0 AS returns, 0 AS late_returns
+            FROM loan LEFT JOIN book ON book.id = loan.book_id LEFT JOIN "user" ON "user".id = loan.customer_id
+            WHERE loan.loan_date IS NOT NULL
+            UNION ALL
+            SELECT date(loan.return_date), coalesce(book.book_type, 0), coalesce("user".city, ''),
+                   0, 1, CASE WHEN loan.return_date > loan.due_date THEN 1 ELSE 0 END
+            FROM loan LEFT JOIN book ON book.id = loan.book_id LEFT JOIN "user" ON "user".id = loan.customer_id
+            WHERE loan.return_date IS NOT NULL
+        ) AS events
+        GROUP BY day, book_type, city
+    """)
+    op.execute("""
+        INSERT INTO book_loan_count (book_id, loans)
+        SELECT book_id, count(*) FROM loan WHERE book_id IS NOT NULL GROUP BY book_id
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('book_loan_count', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_book_loan_count_loans'))
+
+    op.drop_table('book_loan_count')
+    op.drop_table('loan_stats')
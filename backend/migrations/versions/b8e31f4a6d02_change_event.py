@@ -0,0 +1,29 @@
+"""change event table relaying /events between workers
+
+Revision ID: b8e31f4a6d02
+Revises: d2b7e4f1c9a3
+Create Date: 2026-10-18 18:41:09.627114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8e31f4a6d02'
+down_revision = 'd2b7e4f1c9a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('change_event',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('type', sa.String(length=32), nullable=False),
+    sa.Column('data', sa.Text(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('change_event')
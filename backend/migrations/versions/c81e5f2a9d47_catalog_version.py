@@ -0,0 +1,29 @@
+"""catalog version counter for cached responses
+
+Revision ID: c81e5f2a9d47
+Revises: a4d17c2e9b05
+Create Date: 2026-10-18 09:12:37.504218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c81e5f2a9d47'
+down_revision = 'a4d17c2e9b05'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    catalog_version = op.create_table('catalog_version',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.bulk_insert(catalog_version, [{'id': 1, 'version': 0}])
+
+
+def downgrade():
+    op.drop_table('catalog_version')
@@ -0,0 +1,96 @@
+"""typo vocabulary and prefix index of the search indexes
+
+Revision ID: d2b7e4f1c9a3
+Revises: f6a83c1e2d59
+Create Date: 2026-10-18 09:12:40.318206
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2b7e4f1c9a3'
+down_revision = 'f6a83c1e2d59'
+branch_labels = None
+depends_on = None
+
+
+# (index, table, indexed columns), as in 7f2c9e4b1a63
+INDEXES = [
+    ('book_search', 'book', ['name', 'author']),
+    ('user_search', 'user', ['name', 'city']),
+]
+# Read as spaces between words; search.SEPARATORS must list the same
+SEPARATORS = '.,:;!?()[]"/&-\t\n'
+# Longer words are left out, they would only add variants
+MAX_WORD_LENGTH = 30
+
+
+def words_view(index):
+    # Every word of 3 to MAX_WORD_LENGTH letters of the text in {index}_pending,
+    # lowered, and its variants with one letter dropped. Triggers cannot hold a
+    # WITH clause, but they can read a view that does.
+    normalized = 'text'
+    for separator in SEPARATORS:
+        normalized = f"replace({normalized}, char({ord(separator)}), ' ')"
+    return f"""
+        CREATE VIEW {index}_words AS
+        WITH RECURSIVE split(word, rest) AS (
+            SELECT '', lower({normalized}) || ' ' FROM {index}_pending
+            UNION ALL
+            SELECT substr(rest, 1, instr(rest, ' ') - 1), substr(rest, instr(rest, ' ') + 1) FROM split WHERE rest <> ''
+        ),
+        word(word) AS (
+            SELECT DISTINCT word FROM split WHERE length(word) BETWEEN 3 AND {MAX_WORD_LENGTH}
+        ),
+        dropped(word, i) AS (
+            SELECT word, 0 FROM word
+            UNION ALL
+            SELECT word, i + 1 FROM dropped WHERE i < length(word)
+        )
+        SELECT CASE WHEN i = 0 THEN word ELSE substr(word, 1, i - 1) || substr(word, i + 1) END AS variant, word
+        FROM dropped
+    """
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        # Like the FTS5 indexes, SQLite only
+        return
+    for index, table, columns in INDEXES:
+        text = " || ' ' || ".join(f"coalesce({{row}}.{column}, '')" for column in columns)
+        collect = [f'INSERT OR IGNORE INTO {index}_typo (variant, word) SELECT variant, word FROM {index}_words;',
+                   f'DELETE FROM {index}_pending;']
+
+        # The vocabulary only grows: a word left over from a deleted or changed
+        # row costs a lookup that finds nothing
+        op.execute(f'CREATE TABLE {index}_typo (variant TEXT NOT NULL, word TEXT NOT NULL, PRIMARY KEY (variant, word)) WITHOUT ROWID')
+        op.execute(f'CREATE TABLE {index}_pending (text TEXT NOT NULL)')
+        op.execute(words_view(index))
+        op.execute(
+            f'CREATE TRIGGER {index}_typo_insert AFTER INSERT ON "{table}" BEGIN '
+            f'INSERT INTO {index}_pending (text) VALUES ({text.format(row="new")}); {" ".join(collect)} END'
+        )
+        op.execute(
+            f'CREATE TRIGGER {index}_typo_update AFTER UPDATE OF {", ".join(columns)} ON "{table}" BEGIN '
+            f'INSERT INTO {index}_pending (text) VALUES ({text.format(row="new")}); {" ".join(collect)} END'
+        )
+        # For terms too short for trigrams, matched as a prefix of the first column
+        op.execute(f'CREATE INDEX ix_{table}_{columns[0]}_lower ON "{table}" (lower({columns[0]}))')
+        # The words of the rows that already exist
+        op.execute(f'INSERT INTO {index}_pending (text) SELECT {text.format(row=table)} FROM "{table}"')
+        for statement in collect:
+            op.execute(statement)
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for index, table, columns in INDEXES:
+        op.execute(f'DROP INDEX ix_{table}_{columns[0]}_lower')
+        op.execute(f'DROP TRIGGER {index}_typo_update')
+        op.execute(f'DROP TRIGGER {index}_typo_insert')
+        op.execute(f'DROP VIEW {index}_words')
+        op.execute(f'DROP TABLE {index}_pending')
+        op.execute(f'DROP TABLE {index}_typo')
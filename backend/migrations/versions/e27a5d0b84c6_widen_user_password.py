@@ -0,0 +1,32 @@
+"""widen user.password for current hash formats
+
+Revision ID: e27a5d0b84c6
+Revises: 9c4e1a7f3d28
+Create Date: 2026-10-17 11:02:17.903551
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e27a5d0b84c6'
+down_revision = '9c4e1a7f3d28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.alter_column('password',
+               existing_type=sa.String(length=50),
+               type_=sa.String(length=255),
+               existing_nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.alter_column('password',
+               existing_type=sa.String(length=255),
+               type_=sa.String(length=50),
+               existing_nullable=False)
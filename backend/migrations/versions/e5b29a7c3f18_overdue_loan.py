@@ -0,0 +1,40 @@
+"""materialized overdue loans and the scan watermark
+
+Revision ID: e5b29a7c3f18
+Revises: c81e5f2a9d47
+Create Date: 2026-10-18 11:04:52.118630
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b29a7c3f18'
+down_revision = 'c81e5f2a9d47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('overdue_loan',
+    sa.Column('loan_id', sa.Integer(), nullable=False),
+    sa.Column('book_id', sa.Integer(), nullable=False),
+    sa.Column('customer_id', sa.Integer(), nullable=True),
+    sa.Column('loan_date', sa.DateTime(), nullable=True),
+    sa.Column('due_date', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['loan_id'], ['loan.id'], ),
+    sa.PrimaryKeyConstraint('loan_id')
+    )
+    overdue_watermark = op.create_table('overdue_watermark',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('marked_until', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    # No watermark yet: the first scan marks every open loan already overdue
+    op.bulk_insert(overdue_watermark, [{'id': 1, 'marked_until': None}])
+
+
+def downgrade():
+    op.drop_table('overdue_watermark')
+    op.drop_table('overdue_loan')
@@ -0,0 +1,37 @@
+"""loan archive table for old returned loans
+
+Revision ID: f6a83c1e2d59
+Revises: b3f9d21c6a47
+Create Date: 2026-10-18 16:02:41.208315
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f6a83c1e2d59'
+down_revision = 'b3f9d21c6a47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('loan_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('customer_id', sa.Integer(), nullable=True),
+    sa.Column('book_id', sa.Integer(), nullable=True),
+    sa.Column('loan_date', sa.DateTime(), nullable=True),
+    sa.Column('return_date', sa.DateTime(), nullable=False),
+    sa.Column('due_date', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    # Put the archived loans back before dropping the table
+    op.execute("""
+        INSERT INTO loan (id, customer_id, book_id, loan_date, return_date, due_date)
+        SELECT id, customer_id, book_id, loan_date, return_date, due_date FROM loan_archive
+    """)
+    op.drop_table('loan_archive')
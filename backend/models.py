@@ -0,0 +1,123 @@
+from datetime import datetime, timedelta
+
+import jwt
+from flask import current_app
+
+from extensions import db
+
+
+class User(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False, index=True)
+    city = db.Column(db.String(50), nullable=False)
+    age = db.Column(db.Integer, nullable=True)
+    username = db.Column(db.String(50), unique=True, nullable=False)  # The unique constraint already indexes it
+    password = db.Column(db.String(255), nullable=False)
+    is_admin = db.Column(db.Boolean, default=False)
+    books = db.relationship('Book', backref='user', lazy=True)  # Change backref name to 'customer'
+    loans = db.relationship('Loan', backref='user', lazy=True)
+
+
+    def generate_token(self):
+        payload = {
+            'exp': datetime.utcnow() + timedelta(days=1),
+            'iat': datetime.utcnow(),
+            'sub': self.id
+        }
+        return jwt.encode(payload, current_app.config['SECRET_KEY'], algorithm='HS256')
+    
+
+class Loan(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    customer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    book_id = db.Column(db.Integer, db.ForeignKey('book.id'), nullable=True)
+    loan_date = db.Column(db.DateTime, nullable=True)
+    return_date = db.Column(db.DateTime, nullable=True)
+    due_date = db.Column(db.DateTime, nullable=True)  # Set from the loan policy when the loan is created
+
+    __table_args__ = (
+        db.Index('ix_loan_return_date_due_date', 'return_date', 'due_date'),  # Overdue scans
+        db.Index('ix_loan_book_id_customer_id_return_date', 'book_id', 'customer_id', 'return_date'),  # Open loan lookup on return
+        # At most one open loan per book
+        db.Index('uq_loan_open_book', 'book_id', unique=True,
+                 sqlite_where=db.text('return_date IS NULL'), postgresql_where=db.text('return_date IS NULL')),
+    )
+
+class LoanPolicy(db.Model):
+    book_type = db.Column(db.Integer, primary_key=True)
+    max_days = db.Column(db.Integer, nullable=False)
+
+class CatalogVersion(db.Model):
+    # A single row counting changes to books and loans. Cached catalog
+    # responses are keyed by it, so bumping it invalidates all of them.
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class ChangeEvent(db.Model):
+    # Events for /events, written in the transaction that made the change
+    # (publish_after_commit()) and relayed to every worker's EventBus from
+    # here. The id is the SSE event id. Only the last EVENTS_HISTORY are kept.
+    __tablename__ = 'change_event'
+    id = db.Column(db.Integer, primary_key=True)
+    type = db.Column(db.String(32), nullable=False)
+    data = db.Column(db.Text, nullable=False)
+
+class Book(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False, index=True)
+    author = db.Column(db.String(100), nullable=False)
+    year_published = db.Column(db.Integer, nullable=False)
+    book_type = db.Column(db.Integer, nullable=False)
+    image_path = db.Column(db.String(100), nullable=True)
+    customer_id = db.Column(db.Integer, db.ForeignKey('user.id'))  # Change foreign key name to 'customer_id'
+    loans = db.relationship('Loan', backref='book', lazy=True)  # Define relationship backref
+
+class OverdueLoan(db.Model):
+    # Open loans past their due date, filled in by mark_overdue_loans() and
+    # emptied as they are returned, so /books/return reads only its results
+    loan_id = db.Column(db.Integer, db.ForeignKey('loan.id'), primary_key=True)
+    book_id = db.Column(db.Integer, nullable=False)
+    customer_id = db.Column(db.Integer, nullable=True)
+    loan_date = db.Column(db.DateTime, nullable=True)
+    due_date = db.Column(db.DateTime, nullable=False)
+
+class OverdueWatermark(db.Model):
+    # Single row: loans due before marked_until have been scanned
+    id = db.Column(db.Integer, primary_key=True)
+    marked_until = db.Column(db.DateTime, nullable=True)
+
+class Cover(db.Model):
+    # One row per stored cover file, shared by every book with the same image
+    digest = db.Column(db.String(64), primary_key=True)  # sha256 of the file
+    name = db.Column(db.String(100), nullable=False)  # Path relative to UPLOAD_FOLDER
+    refcount = db.Column(db.Integer, nullable=False, default=0)
+
+class LoanStats(db.Model):
+    # Loans and returns per day, book type and borrower city, kept up to date
+    # by checkout and checkin so /stats never reads the loan history. Rows
+    # rebuilt from history use book_type 0 and city '' for loans whose book
+    # or user has since been deleted.
+    __tablename__ = 'loan_stats'
+    day = db.Column(db.Date, primary_key=True)
+    book_type = db.Column(db.Integer, primary_key=True)
+    city = db.Column(db.String(50), primary_key=True)
+    loans = db.Column(db.Integer, nullable=False, default=0)
+    returns = db.Column(db.Integer, nullable=False, default=0)
+    late_returns = db.Column(db.Integer, nullable=False, default=0)
+
+class BookLoanCount(db.Model):
+    # Loans per book; the index on loans makes the most borrowed books a short index scan
+    book_id = db.Column(db.Integer, primary_key=True)
+    loans = db.Column(db.Integer, nullable=False, default=0, index=True)
+
+class LoanArchive(db.Model):
+    # Closed loans moved out of the loan table by `flask archive-loans`, so
+    # the loan table holds open loans and recent history only. Ids are kept,
+    # and GET /loans?history=1 reads both tables.
+    __tablename__ = 'loan_archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    customer_id = db.Column(db.Integer, nullable=True)
+    book_id = db.Column(db.Integer, nullable=True)
+    loan_date = db.Column(db.DateTime, nullable=True)
+    return_date = db.Column(db.DateTime, nullable=False)
+    due_date = db.Column(db.DateTime, nullable=True)
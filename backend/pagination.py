@@ -0,0 +1,79 @@
+import base64
+import json
+
+from flask import current_app, request
+
+from extensions import db
+
+
+def encode_cursor(last_id):
+    return base64.urlsafe_b64encode(json.dumps({'id': last_id}).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        return int(json.loads(base64.urlsafe_b64decode(padded))['id'])
+    except (ValueError, TypeError, KeyError):
+        raise ValueError('Invalid cursor')
+
+
+def parse_limit(value):
+    if value is None:
+        return current_app.config['PAGE_SIZE']
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if limit < 1:
+        raise ValueError('limit must be positive')
+    return min(limit, current_app.config['MAX_PAGE_SIZE'])
+
+
+def parse_int_arg(name):
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f'{name} must be an integer')
+
+
+def keyset_page(query, key, limit, after):
+    # Seek past the last key of the previous page instead of using OFFSET, so
+    # every page costs the same no matter how deep the client has paged.
+    # Rows must expose the key column as `id`.
+    if after is not None:
+        query = query.where(key > after)
+    rows = db.session.execute(query.order_by(key).limit(limit + 1)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].id)
+    return rows, next_cursor
+
+
+def merge_keyset_pages(pages, limit):
+    # One page out of the keyset_page() results of queries whose keys never
+    # overlap: the lowest keys among them, with a cursor if any query has more
+    rows = sorted((row for page_rows, _ in pages for row in page_rows), key=lambda row: row.id)
+    more = len(rows) > limit or any(next_cursor for _, next_cursor in pages)
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].id) if more else None
+
+
+def search_args():
+    offset = parse_int_arg('offset') or 0
+    if offset < 0:
+        raise ValueError('offset must not be negative')
+    return request.args['q'].strip(), parse_limit(request.args.get('limit')), offset
+
+
+def search_results(index, model, query, limit, offset):
+    # Ranked matches from a search index, loaded in rank order
+    ids, has_more = index.search(db.session, query, limit, offset)
+    rows = {row.id: row for row in model.query.filter(model.id.in_(ids)).all()} if ids else {}
+    return [rows[row_id] for row_id in ids if row_id in rows], (offset + limit if has_more else None)
@@ -0,0 +1,86 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+
+
+class PoolSaturated(Exception):
+    pass
+
+
+def normalize_method(method):
+    # Expand a method the way werkzeug records it in the hash, e.g.
+    # 'pbkdf2:sha256' -> 'pbkdf2:sha256:600000'
+    name, *args = method.split(':')
+    if name == 'pbkdf2':
+        hash_name = args[0] if args else 'sha256'
+        iterations = args[1] if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f'pbkdf2:{hash_name}:{iterations}'
+    if name == 'scrypt':
+        n, r, p = args if args else (2 ** 15, 8, 1)
+        return f'scrypt:{n}:{r}:{p}'
+    return method
+
+
+class PasswordHasher:
+    # Runs password hashing in a process pool so the CPU-bound work neither
+    # holds the GIL of the request worker nor delays its other threads.
+    # At most `workers + queue_size` hashes are in flight per process; past
+    # that PoolSaturated is raised immediately instead of queueing forever.
+
+    def __init__(self, method='pbkdf2:sha256', salt_length=16, workers=2, queue_size=32, timeout=10):
+        self.method = method
+        self.salt_length = salt_length
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # Created on first use so the pool is started after gunicorn forks.
+        # The pool processes come from a fork server rather than a fork of
+        # this process: it already runs threads, and a lock one of them held
+        # at fork time would stay locked in the child forever. As with spawn,
+        # the children import the main module, so a script hashing passwords
+        # needs an `if __name__ == '__main__':` guard.
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context(start_method)
+                    )
+        return self._executor
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PoolSaturated()
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            raise PoolSaturated()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        # True when the stored hash was made with other parameters than the current ones
+        if pwhash.count('$') < 2:
+            return True
+        method, salt, _ = pwhash.split('$', 2)
+        return method != normalize_method(self.method) or len(salt) != self.salt_length
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,166 @@
+import math
+import os
+import sqlite3
+import threading
+from collections import OrderedDict, namedtuple
+
+
+# Outcome of RateLimiter.admit(). A refused request may be retried after
+# retry_after seconds; slot is what release() needs once an admitted request
+# is over, or None.
+Admission = namedtuple('Admission', ['allowed', 'reason', 'retry_after', 'slot'])
+
+
+class MemoryBuckets:
+    # Token buckets of this process. Each key's bucket holds up to `burst`
+    # tokens and refills at `rate` tokens per second; a request takes its
+    # cost or is refused. Beyond max_keys the least recently used bucket is
+    # dropped, which only hands that caller a full bucket again.
+
+    def __init__(self, rate, burst, max_keys=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, updated)
+        self._lock = threading.Lock()
+
+    def take(self, key, cost, now):
+        # Returns (taken, tokens left)
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            taken = tokens >= cost
+            if taken:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return taken, tokens
+
+    def lowest(self, now, limit):
+        # [(key, tokens)] of the emptiest buckets
+        with self._lock:
+            buckets = [(key, min(self.burst, tokens + (now - updated) * self.rate))
+                       for key, (tokens, updated) in self._buckets.items()]
+        return sorted(buckets, key=lambda bucket: bucket[1])[:limit]
+
+    def size(self):
+        return len(self._buckets)
+
+
+class SQLiteBuckets:
+    # The same buckets kept in an SQLite file, so that every worker process
+    # draws from one bucket per caller. A take is a single upsert that only
+    # writes when the bucket has enough tokens. If the file stays locked the
+    # request is let through: the limiter must not take the app down with it.
+    # Buckets that have been full for a while are deleted now and then.
+
+    def __init__(self, path, rate, burst):
+        self.path = path
+        self.rate = rate
+        self.burst = burst
+        self._local = threading.local()
+        self._takes = 0
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS bucket (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)'
+        )
+
+    def _connection(self):
+        # sqlite3 connections may not be shared between threads, nor with a
+        # process forked after the connection was opened
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=wal')
+            connection.execute('PRAGMA synchronous=off')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def take(self, key, cost, now):
+        connection = self._connection()
+        refilled = 'min(:burst, tokens + max(0, :now - updated) * :rate)'
+        parameters = {'key': key, 'cost': cost, 'now': now, 'rate': self.rate, 'burst': self.burst}
+        try:
+            row = connection.execute(
+                'INSERT INTO bucket (key, tokens, updated) VALUES (:key, :burst - :cost, :now) '
+                f'ON CONFLICT (key) DO UPDATE SET tokens = {refilled} - :cost, updated = :now WHERE {refilled} >= :cost '
+                'RETURNING tokens', parameters
+            ).fetchone()
+            if row is None:
+                return False, connection.execute(f'SELECT {refilled} FROM bucket WHERE key = :key', parameters).fetchone()[0]
+            self._takes += 1
+            if self._takes % 1000 == 0:
+                connection.execute('DELETE FROM bucket WHERE updated < ?', (now - self.burst / self.rate,))
+            return True, row[0]
+        except sqlite3.OperationalError:
+            return True, None
+
+    def lowest(self, now, limit):
+        return self._connection().execute(
+            'SELECT key, min(?, tokens + max(0, ? - updated) * ?) AS level FROM bucket ORDER BY level LIMIT ?',
+            (self.burst, now, self.rate, limit)
+        ).fetchall()
+
+    def size(self):
+        return self._connection().execute('SELECT count(*) FROM bucket').fetchone()[0]
+
+
+class RateLimiter:
+    # Admission control for every request: the caller's bucket must hold the
+    # endpoint's cost (costs.get(endpoint, 1), 0 for none), and for the
+    # endpoints in `concurrency` the caller may only have that many requests
+    # in flight in this process. Counters of refusals are kept for /metrics.
+
+    def __init__(self, buckets, costs, concurrency, retry_after=1):
+        self.buckets = buckets
+        self.costs = costs
+        self.concurrency = concurrency
+        self.retry_after = retry_after
+        self.rejected = {'rate': 0, 'concurrency': 0}
+        self._in_flight = {}  # (key, endpoint) -> requests
+        self._lock = threading.Lock()
+
+    def admit(self, key, endpoint, now):
+        # A cost above the burst could never be paid, so it takes the whole bucket
+        cost = min(self.costs.get(endpoint, 1), self.buckets.burst)
+        if cost <= 0:
+            return Admission(True, None, 0, None)
+
+        slot = None
+        limit = self.concurrency.get(endpoint)
+        if limit is not None:
+            slot = (key, endpoint)
+            with self._lock:
+                if self._in_flight.get(slot, 0) >= limit:
+                    self.rejected['concurrency'] += 1
+                    return Admission(False, 'concurrency', self.retry_after, None)
+                self._in_flight[slot] = self._in_flight.get(slot, 0) + 1
+
+        taken, tokens = self.buckets.take(key, cost, now)
+        if not taken:
+            self.release(slot)
+            with self._lock:
+                self.rejected['rate'] += 1
+            return Admission(False, 'rate', max(1, math.ceil((cost - tokens) / self.buckets.rate)), None)
+        return Admission(True, None, 0, slot)
+
+    def release(self, slot):
+        if slot is None:
+            return
+        with self._lock:
+            self._in_flight[slot] -= 1
+            if not self._in_flight[slot]:
+                del self._in_flight[slot]
+
+    def in_flight(self):
+        with self._lock:
+            return dict(self._in_flight)
+
+    def stats(self):
+        with self._lock:
+            return {'rejected_rate': self.rejected['rate'], 'rejected_concurrency': self.rejected['concurrency'],
+                    'in_flight': sum(self._in_flight.values()), 'buckets': self.buckets.size()}
@@ -0,0 +1,132 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict, namedtuple
+
+
+# A cached response body; the ETag is derived from the key and version instead
+Entry = namedtuple('Entry', ['body', 'mimetype'])
+
+
+class SQLiteBackend:
+    # Entries kept in an SQLite file so that every worker process shares them.
+    # Rows of older catalog versions are deleted the first time this process
+    # stores an entry for a newer one; beyond max_entries the oldest rows go.
+
+    def __init__(self, path, max_entries=10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._pruned_version = None
+        self._writes = 0
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS response (key TEXT PRIMARY KEY, version INTEGER NOT NULL, body BLOB NOT NULL, mimetype TEXT NOT NULL)'
+        )
+
+    def _connection(self):
+        # sqlite3 connections may not be shared between threads, nor with a
+        # process forked after the connection was opened
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=wal')
+            connection.execute('PRAGMA synchronous=off')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, key, version):
+        row = self._connection().execute(
+            'SELECT body, mimetype FROM response WHERE key = ? AND version = ?', (key, version)
+        ).fetchone()
+        return Entry(row[0], row[1]) if row else None
+
+    def set(self, key, version, entry):
+        connection = self._connection()
+        try:
+            connection.execute(
+                'INSERT OR REPLACE INTO response (key, version, body, mimetype) VALUES (?, ?, ?, ?)',
+                (key, version, entry.body, entry.mimetype)
+            )
+            if self._pruned_version is None or version > self._pruned_version:
+                self._pruned_version = version
+                connection.execute('DELETE FROM response WHERE version < ?', (version,))
+            self._writes += 1
+            if self._writes % 100 == 0:
+                connection.execute(
+                    'DELETE FROM response WHERE rowid IN (SELECT rowid FROM response ORDER BY rowid DESC LIMIT -1 OFFSET ?)',
+                    (self.max_entries,)
+                )
+        except sqlite3.OperationalError:
+            # Another worker holds the lock; the entry is only an optimisation
+            pass
+
+
+class ResponseCache:
+    # In-process LRU of rendered responses, in front of an optional shared
+    # backend. Entries are stored under (key, version) where version is the
+    # catalog version counter: any write to the catalog bumps it, so entries
+    # of older versions are never served again and are dropped as soon as a
+    # newer version is seen.
+
+    def __init__(self, maxsize=1024, backend=None):
+        self.maxsize = maxsize
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def etag(self, key, version):
+        return hashlib.sha1(key.encode()).hexdigest()[:16] + f'-{version}'
+
+    def _see(self, version):
+        # Called with the lock held
+        if self._version is None or version > self._version:
+            self._version = version
+            self._entries.clear()
+
+    def get(self, key, version):
+        with self._lock:
+            self._see(version)
+            entry = self._entries.get(key)
+            if entry is not None and self._version == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+        entry = self.backend.get(key, version) if self.backend else None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._store(key, version, entry)
+        return entry
+
+    def set(self, key, version, entry):
+        with self._lock:
+            self._see(version)
+            self._store(key, version, entry)
+        if self.backend:
+            self.backend.set(key, version, entry)
+
+    def _store(self, key, version, entry):
+        if version != self._version:
+            return
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
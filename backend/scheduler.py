@@ -0,0 +1,61 @@
+import logging
+import os
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+class Scheduler:
+    # Runs `task` over and over in a daemon thread, or in the calling thread
+    # with run_forever(). task() returns how many seconds it wants to sleep
+    # before its next run, or None; the wait never exceeds `interval`, and
+    # wake() cuts it short. The thread is started again after a fork (e.g. in
+    # each gunicorn worker).
+
+    def __init__(self, task, interval=60, name='scheduler'):
+        self.task = task
+        self.interval = interval
+        self.name = name
+        self._pid = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run_forever, name=self.name, daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread and self._pid == os.getpid():
+            self._thread.join()
+        self._pid = None
+
+    def wake(self):
+        # Run the task now rather than at the end of the current wait
+        self._wake.set()
+
+    def run_once(self):
+        try:
+            wait = self.task()
+        except Exception:
+            logger.exception('%s: task failed', self.name)
+            wait = None
+        if wait is None:
+            return self.interval
+        return max(1, min(wait, self.interval))
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.run_once())
+            self._wake.clear()
@@ -0,0 +1,165 @@
+import string
+
+from sqlalchemy import bindparam, text
+
+
+class SearchIndex:
+    # An SQLite FTS5 index over some text columns of a table, using the trigram
+    # tokenizer so that any substring of three or more characters can be matched.
+    # The index and the triggers that keep it in sync with every INSERT, UPDATE
+    # and DELETE on the table are created by a migration. So is {name}_typo,
+    # the vocabulary of the columns: each word, and each word with one letter
+    # dropped, pointing at the word (its deletion neighbourhood).
+
+    def __init__(self, name, table, columns, weights):
+        self.name = name
+        self.table = table
+        self.columns = columns
+        self.weights = weights
+
+    def search(self, session, query, limit, offset=0):
+        # Ranked ids of rows matching `query`, and whether there are more.
+        # The candidates are the best rows containing every term, and the best
+        # rows where some terms only appear give or take a typo (see _fuzzy());
+        # they are then ranked by how well their words match the terms.
+        terms = query.split()
+        wanted = offset + limit + 1
+        if not terms:
+            return [], False
+
+        if session.get_bind().dialect.name != 'sqlite':
+            ids = self._scan(session, terms, wanted)
+        elif any(len(term) < 3 for term in terms):
+            # Too short for trigrams: fall back to a prefix match on the first
+            # column, a range over the index on its lower()
+            prefix = ' '.join(terms).translate(LOWER_TABLE)
+            column = f'lower({self.columns[0]})'
+            rows = session.execute(
+                text(f'SELECT id FROM "{self.table}" WHERE {column} >= :low AND {column} < :high ORDER BY {column} LIMIT :limit'),
+                {'low': prefix, 'high': prefix[:-1] + chr(ord(prefix[-1]) + 1), 'limit': wanted}
+            ).all()
+            ids = [row[0] for row in rows]
+        else:
+            exact = ' AND '.join(quote(term) for term in terms)
+            ids = self._match(session, exact, wanted)
+            seen = set(ids)
+            ids += [row_id for row_id in self._fuzzy(session, terms, exact, wanted) if row_id not in seen]
+            ids = self._rank(session, words(' '.join(terms)), ids)
+
+        return ids[offset:offset + limit], len(ids) > offset + limit
+
+    def _match(self, session, expression, limit):
+        weights = ', '.join(str(weight) for weight in self.weights)
+        rows = session.execute(
+            text(f'SELECT rowid FROM {self.name} WHERE {self.name} MATCH :expression ORDER BY bm25({self.name}, {weights}) LIMIT :limit'),
+            {'expression': expression, 'limit': limit}
+        ).all()
+        return [row[0] for row in rows]
+
+    def _fuzzy(self, session, terms, exact, limit):
+        # Rows without every term but with, for each term, the term or a word
+        # one typo away from it. Two words are one typo apart only if one of
+        # them or one of its variants with a letter dropped is also one of the
+        # other's, so such words are read from {name}_typo by those variants,
+        # each an index lookup, and the few false hits are dropped by one_typo().
+        keys = [key for key in words(' '.join(terms)) if len(key) >= 3]
+        variants = set().union(*(neighbourhood(key) for key in keys))
+        if not variants:
+            return []
+        found = session.execute(
+            text(f'SELECT DISTINCT word FROM {self.name}_typo WHERE variant IN :variants').bindparams(
+                bindparam('variants', expanding=True)
+            ),
+            {'variants': sorted(variants)}
+        ).scalars().all()
+        groups, typos = [], False
+        for key in keys:
+            close = [word for word in found if word != key and one_typo(key, word)]
+            typos = typos or bool(close)
+            groups.append('(' + ' OR '.join(quote(word) for word in [key] + close) + ')')
+        if not typos:
+            return []
+        return self._match(session, f'({" AND ".join(groups)}) NOT ({exact})', limit)
+
+    def _rank(self, session, keys, ids):
+        # For each term, 0 when a word of the row starts with it, 1 when one
+        # is a typo away from it, 2 when the start of one is, else 3 (the term
+        # is inside a word). Rows with the lowest sum come first; sorted() is
+        # stable, so equally close rows keep their bm25 order, exact ones first.
+        if not ids:
+            return ids
+        rows = session.execute(
+            text(f'SELECT id, {", ".join(self.columns)} FROM "{self.table}" WHERE id IN :ids').bindparams(
+                bindparam('ids', expanding=True)
+            ),
+            {'ids': ids}
+        ).all()
+        texts = {row[0]: words(' '.join(value or '' for value in row[1:])) for row in rows}
+        return sorted(ids, key=lambda row_id: sum(closeness(key, texts.get(row_id, [])) for key in keys))
+
+    def _scan(self, session, terms, limit):
+        # Without FTS5 (e.g. on PostgreSQL): rows where every term appears in
+        # one of the columns, unranked and with no typo tolerance
+        conditions, params = [], {'limit': limit}
+        for i, term in enumerate(terms):
+            params[f'term{i}'] = '%' + term.replace('%', '').replace('_', '') + '%'
+            conditions.append('(' + ' OR '.join(f'{column} ILIKE :term{i}' for column in self.columns) + ')')
+        rows = session.execute(
+            text(f'SELECT id FROM "{self.table}" WHERE {" AND ".join(conditions)} ORDER BY id LIMIT :limit'),
+            params
+        ).all()
+        return [row[0] for row in rows]
+
+
+# Characters the {name}_words views of the migration read as spaces, so
+# that words are split the same way here and there
+SEPARATORS = '.,:;!?()[]"/&-\t\n'
+LOWER_TABLE = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+WORD_TABLE = str.maketrans(string.ascii_uppercase + SEPARATORS, string.ascii_lowercase + ' ' * len(SEPARATORS))
+
+
+def words(text):
+    # The words of `text` as the vocabulary has them: SQLite's lower() only
+    # lowers ASCII letters
+    return text.translate(WORD_TABLE).split()
+
+
+def neighbourhood(word):
+    # The word and every variant of it with one letter dropped
+    return {word} | {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+def one_typo(a, b):
+    # True when a and b differ by at most one letter added, dropped or
+    # changed, or by two neighbouring letters swapped
+    if a == b:
+        return True
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) < len(b):
+        return a[i:] == b[i + 1:]
+    return a[i + 1:] == b[i + 1:] or (a[i + 1:i + 2] == b[i:i + 1] and a[i:i + 1] == b[i + 1:i + 2] and a[i + 2:] == b[i + 2:])
+
+
+def closeness(key, row_words):
+    # See SearchIndex._rank()
+    if any(word.startswith(key) for word in row_words):
+        return 0
+    if any(one_typo(key, word) for word in row_words):
+        return 1
+    if any(one_typo(key, word[:len(key)]) for word in row_words):
+        return 2
+    return 3
+
+
+def quote(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+book_index = SearchIndex('book_search', 'book', ['name', 'author'], [2.0, 1.0])
+user_index = SearchIndex('user_search', 'user', ['name', 'city'], [2.0, 1.0])
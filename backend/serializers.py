@@ -0,0 +1,153 @@
+import codecs
+import re
+from datetime import date, datetime
+from functools import lru_cache
+from json.encoder import encode_basestring_ascii
+from operator import itemgetter
+
+from flask import current_app
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+COMPACT = {'separators': (',', ':')}
+
+
+def escape_non_ascii(error):
+    # Encoding error handler: each run of non-ASCII characters becomes the
+    # \uXXXX escapes json.dumps(ensure_ascii=True) would have written
+    return encode_basestring_ascii(error.object[error.start:error.end])[1:-1], error.end
+
+
+codecs.register_error('json_escape', escape_non_ascii)
+
+# A string, or the exponent of a float: orjson writes 1e16 and 1e-7 where
+# json.dumps writes 1e+16 and 1e-07
+EXPONENT = re.compile(rb'"(?:[^"\\]|\\.)*"|(?<=[0-9])e(-?)([0-9]+)')
+
+
+def python_exponent(match):
+    if match.group(2) is None:
+        return match.group(0)
+    return b'e' + (match.group(1) or b'+') + match.group(2).zfill(2)
+
+
+class JSONProvider(DefaultJSONProvider):
+    # Flask's provider with orjson doing the encoding when it is installed.
+    # The bytes match what the standard library writes: orjson is only used
+    # for compact output, non-ASCII text and DEL are escaped afterwards, float
+    # exponents are rewritten, and types orjson cannot encode go through
+    # json.dumps instead. The one difference: NaN and infinities are written
+    # as null, where json.dumps writes NaN and Infinity (which are not JSON).
+    # Datetimes are written as ISO-8601 to the second unless JSON_LEGACY_DATES
+    # is set, which keeps Flask's HTTP-date format.
+
+    @property
+    def legacy_dates(self):
+        return self._app.config.get('JSON_LEGACY_DATES', False)
+
+    def default(self, o):
+        if not self.legacy_dates:
+            if isinstance(o, datetime):
+                return o.isoformat(timespec='seconds')
+            if isinstance(o, date):
+                return o.isoformat()
+        return DefaultJSONProvider.default(o)
+
+    def _orjson_dumps(self, obj):
+        option = orjson.OPT_PASSTHROUGH_DATACLASS
+        option |= orjson.OPT_PASSTHROUGH_DATETIME if self.legacy_dates else orjson.OPT_OMIT_MICROSECONDS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            data = orjson.dumps(obj, default=self.default, option=option)
+        except orjson.JSONEncodeError:
+            return None
+        if self.ensure_ascii and not data.isascii():
+            data = data.decode().encode('ascii', 'json_escape')
+        if self.ensure_ascii and b'\x7f' in data:
+            data = data.replace(b'\x7f', b'\\u007f')
+        if re.search(rb'[0-9]e-?[0-9]', data):
+            data = EXPONENT.sub(python_exponent, data)
+        return data
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None and kwargs == COMPACT:
+            data = self._orjson_dumps(obj)
+            if data is not None:
+                return data.decode()
+        return super().dumps(obj, **kwargs)
+
+    def response(self, *args, **kwargs):
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        if orjson is not None and not indent:
+            data = self._orjson_dumps(self._prepare_response_obj(args, kwargs))
+            if data is not None:
+                return self._app.response_class(data + b'\n', mimetype=self.mimetype)
+        return super().response(*args, **kwargs)
+
+
+def strftime(pattern):
+    # A converter writing dates the way responses did before ISO-8601
+    return lambda value: value.strftime(pattern) if value is not None else None
+
+
+def iso_date(value):
+    if value is None:
+        return None
+    return value.isoformat(timespec='seconds') if isinstance(value, datetime) else value.isoformat()
+
+
+def legacy_dates():
+    return current_app.config['JSON_LEGACY_DATES']
+
+
+def format_date(value, legacy_format):
+    # For dates written outside a RowSerializer, such as event payloads
+    if legacy_dates():
+        return value.strftime(legacy_format) if value is not None else None
+    return iso_date(value)
+
+
+@lru_cache(maxsize=256)
+def compile_row(fields, columns):
+    # A function turning a row into {'name': row[1], ...}, built once per field
+    # list: itemgetter picks the columns of a row in one call, so a page of
+    # rows becomes dicts without a Python loop over the fields of each row
+    pick = itemgetter(*(columns.index(field) for field in fields))
+    if len(fields) == 1:
+        return lambda row: {fields[0]: pick(row)}
+    return lambda row: dict(zip(fields, pick(row)))
+
+
+class RowSerializer:
+    # Turns result rows into dicts for a JSON response. fields are the keys
+    # written, in order; columns name the positions of the row (defaults to
+    # fields). Converters run over a whole column at a time. Datetimes are
+    # left to the JSON provider, which writes them as ISO-8601; with legacy
+    # set, the legacy converters (usually strftime) run as well.
+
+    def __init__(self, fields, columns=None, converters=None, legacy=None):
+        self.fields = tuple(fields)
+        self.columns = tuple(columns or fields)
+        self._converters = converters or {}
+        self._legacy = dict(self._converters, **(legacy or {}))
+
+    def __call__(self, rows, legacy=False):
+        build = compile_row(self.fields, self.columns)
+        converters = self._legacy if legacy else self._converters
+        if converters and rows:
+            columns = list(zip(*rows))
+            for index, column in enumerate(self.columns):
+                if column in converters:
+                    columns[index] = map(converters[column], columns[index])
+            rows = zip(*columns)
+        return list(map(build, rows))
+
+    def only(self, fields, columns):
+        # The same converters over a subset of the fields
+        return RowSerializer(fields, columns, self._converters, self._legacy)
@@ -0,0 +1,178 @@
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+import click
+from flask import Blueprint, current_app, jsonify, request
+from sqlalchemy.dialects import postgresql, sqlite
+
+from auth import login_required
+from extensions import db
+from models import Book, BookLoanCount, Loan, LoanArchive, LoanStats, User
+from serializers import RowSerializer, iso_date
+
+
+bp = Blueprint('stats', __name__)
+
+UNKNOWN_BOOK_TYPE = 0
+UNKNOWN_CITY = ''
+
+
+def add_counts(model, keys, rows):
+    # INSERT ... ON CONFLICT DO UPDATE adding the counters of each row to the
+    # row with the same keys, in the caller's transaction
+    counters = [column for column in rows[0] if column not in keys]
+    dialect = postgresql if db.session.get_bind().dialect.name == 'postgresql' else sqlite
+    statement = dialect.insert(model)
+    statement = statement.on_conflict_do_update(
+        index_elements=keys,
+        set_={column: getattr(model, column) + getattr(statement.excluded, column) for column in counters}
+    )
+    db.session.execute(statement, rows)
+
+
+def user_city(user_id):
+    return db.session.scalar(db.select(User.city).where(User.id == user_id))
+
+
+def count_loans(user_id, loan_date, books):
+    # books: (book_id, book_type) of the books just loaned to the user
+    city = user_city(user_id)
+    per_type = Counter(book_type for _, book_type in books)
+    add_counts(LoanStats, ['day', 'book_type', 'city'], [
+        {'day': loan_date.date(), 'book_type': book_type, 'city': city, 'loans': loans, 'returns': 0, 'late_returns': 0}
+        for book_type, loans in per_type.items()
+    ])
+    add_counts(BookLoanCount, ['book_id'], [{'book_id': book_id, 'loans': 1} for book_id, _ in books])
+
+
+def count_returns(user_id, return_date, returns):
+    # returns: (book_type, late) of the books just returned by the user
+    city = user_city(user_id)
+    per_type = Counter()
+    for book_type, late in returns:
+        per_type[book_type, 'returns'] += 1
+        per_type[book_type, 'late_returns'] += late
+    add_counts(LoanStats, ['day', 'book_type', 'city'], [
+        {'day': return_date.date(), 'book_type': book_type, 'city': city, 'loans': 0,
+         'returns': per_type[book_type, 'returns'], 'late_returns': per_type[book_type, 'late_returns']}
+        for book_type in {book_type for book_type, _ in returns}
+    ])
+
+
+def rebuild_stats():
+    # Recompute both tables from the loan history, archive included, with one
+    # INSERT ... SELECT each, grouped in the database. Returns the number of
+    # loans counted.
+    db.session.execute(db.delete(LoanStats))
+    db.session.execute(db.delete(BookLoanCount))
+
+    book_type = db.func.coalesce(Book.book_type, UNKNOWN_BOOK_TYPE)
+    city = db.func.coalesce(User.city, UNKNOWN_CITY)
+    # One loan and one return event per loan, from the loan table and the archive
+    events = []
+    for model in (Loan, LoanArchive):
+        history = db.select(model).outerjoin(Book, Book.id == model.book_id).outerjoin(User, User.id == model.customer_id)
+        events.append(history.with_only_columns(
+            db.func.date(model.loan_date).label('day'), book_type.label('book_type'), city.label('city'),
+            db.literal(1).label('loans'), db.literal(0).label('returns'), db.literal(0).label('late_returns')
+        ).where(model.loan_date.is_not(None)))
+        events.append(history.with_only_columns(
+            db.func.date(model.return_date), book_type, city, db.literal(0), db.literal(1),
+            db.case((model.return_date > model.due_date, 1), else_=0)
+        ).where(model.return_date.is_not(None)))
+    events = db.union_all(*events).subquery()
+    db.session.execute(db.insert(LoanStats).from_select(
+        ['day', 'book_type', 'city', 'loans', 'returns', 'late_returns'],
+        db.select(
+            events.c.day, events.c.book_type, events.c.city,
+            db.func.sum(events.c.loans), db.func.sum(events.c.returns), db.func.sum(events.c.late_returns)
+        ).group_by(events.c.day, events.c.book_type, events.c.city)
+    ))
+    book_ids = db.union_all(
+        db.select(Loan.book_id.label('book_id')).where(Loan.book_id.is_not(None)),
+        db.select(LoanArchive.book_id).where(LoanArchive.book_id.is_not(None))
+    ).subquery()
+    db.session.execute(db.insert(BookLoanCount).from_select(
+        ['book_id', 'loans'],
+        db.select(book_ids.c.book_id, db.func.count()).group_by(book_ids.c.book_id)
+    ))
+    counted = db.session.scalar(db.select(db.func.coalesce(db.func.sum(LoanStats.loans), 0)))
+    db.session.commit()
+    return counted
+
+
+def parse_day(name, default):
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'{name} must be a date, e.g. 2024-05-01')
+
+
+def with_late_rate(rows):
+    for row in rows:
+        row['late_rate'] = round(row['late_returns'] / row['returns'], 4) if row['returns'] else None
+    return rows
+
+
+daily_rows = RowSerializer(['day', 'loans', 'returns', 'late_returns'], converters={'day': iso_date})
+book_type_rows = RowSerializer(['book_type', 'loans', 'returns', 'late_returns'],
+                               converters={'book_type': lambda value: None if value == UNKNOWN_BOOK_TYPE else value})
+city_rows = RowSerializer(['city', 'loans', 'returns', 'late_returns'],
+                          converters={'city': lambda value: None if value == UNKNOWN_CITY else value})
+top_book_rows = RowSerializer(['id', 'name', 'author', 'loans'])
+
+
+@bp.route('/stats', methods=['GET'])
+@login_required
+def get_stats():
+    try:
+        until = parse_day('to', datetime.utcnow().date())
+        since = parse_day('from', until - timedelta(days=current_app.config['STATS_DAYS'] - 1))
+        top = int(request.args.get('top', current_app.config['STATS_TOP']))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if since > until:
+        return jsonify({'error': 'from must not be after to'}), 400
+    if top < 0:
+        return jsonify({'error': 'top must not be negative'}), 400
+    top = min(top, current_app.config['STATS_TOP_MAX'])
+
+    # Every query reads only the aggregate rows of the window, whatever the history size
+    sums = [db.func.sum(LoanStats.loans), db.func.sum(LoanStats.returns), db.func.sum(LoanStats.late_returns)]
+    window = db.select(*sums).where(LoanStats.day >= since, LoanStats.day <= until)
+    loans, returns, late_returns = db.session.execute(window).one()
+    totals = {'loans': loans or 0, 'returns': returns or 0, 'late_returns': late_returns or 0}
+    by_book_type = db.session.execute(
+        window.with_only_columns(LoanStats.book_type, *sums)
+        .group_by(LoanStats.book_type).order_by(LoanStats.book_type)
+    ).all()
+    by_city = db.session.execute(
+        window.with_only_columns(LoanStats.city, *sums).group_by(LoanStats.city).order_by(sums[0].desc(), LoanStats.city)
+    ).all()
+    daily = db.session.execute(window.with_only_columns(LoanStats.day, *sums).group_by(LoanStats.day).order_by(LoanStats.day)).all()
+    top_books = db.session.execute(
+        db.select(Book.id, Book.name, Book.author, BookLoanCount.loans)
+        .join(Book, Book.id == BookLoanCount.book_id)
+        .order_by(BookLoanCount.loans.desc(), BookLoanCount.book_id)
+        .limit(top)
+    ).all()
+
+    return jsonify({
+        'from': since.isoformat(),
+        'to': until.isoformat(),
+        'totals': with_late_rate([totals])[0],
+        'by_book_type': with_late_rate(book_type_rows(by_book_type)),
+        'by_city': with_late_rate(city_rows(by_city)),
+        'daily': with_late_rate(daily_rows(daily)),
+        'top_books': top_book_rows(top_books),
+    }), 200
+
+
+@bp.cli.command('rebuild')
+def rebuild_stats_command():
+    """Recompute the /stats tables from the loan history."""
+    counted = rebuild_stats()
+    click.echo(f'Rebuilt the stats from {counted} loans')
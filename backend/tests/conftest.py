@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from extensions import db, upgrade_database  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path):
+    # A fresh app on its own SQLite file, built by the migrations
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "test.db"}',
+        'OVERDUE_SCHEDULER': 'off',
+        'RATE_LIMIT': False,
+        'EVENTS_RELAY': 'off',
+    })
+    upgrade_database(app)
+    with app.app_context():
+        yield app
+        db.session.remove()
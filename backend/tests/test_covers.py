@@ -0,0 +1,82 @@
+import io
+import os
+
+import pytest
+
+import covers
+from books import collect_cover, release_cover, store_cover
+from extensions import db
+from models import Cover
+
+
+@pytest.fixture
+def uploads(app, tmp_path):
+    app.config['UPLOAD_FOLDER'] = str(tmp_path / 'uploads')
+    return tmp_path / 'uploads'
+
+
+def test_same_image_is_stored_once(uploads):
+    first = store_cover(io.BytesIO(b'cover'), 'png')
+    second = store_cover(io.BytesIO(b'cover'), 'jpg')
+    db.session.commit()
+    # The second upload takes a reference to the first one's file
+    assert first == second
+    assert [(cover.name, cover.refcount) for cover in Cover.query.all()] == [(os.path.relpath(first, uploads).replace(os.sep, '/'), 2)]
+    assert os.path.exists(first)
+    assert not list(uploads.glob('.upload-*'))
+
+
+def test_failed_store_removes_the_spooled_file(uploads, monkeypatch):
+    def fail(*args):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(covers, 'place', fail)
+    with pytest.raises(OSError):
+        store_cover(io.BytesIO(b'cover'), 'png')
+    db.session.rollback()
+    assert not list(uploads.glob('.upload-*'))
+    assert Cover.query.count() == 0
+
+
+def test_unreferenced_cover_is_collected(uploads):
+    path = store_cover(io.BytesIO(b'cover'), 'png')
+    db.session.commit()
+    digest = release_cover(path)
+    db.session.commit()
+
+    collect_cover(digest)
+    assert Cover.query.count() == 0
+    assert not os.path.exists(path)
+    assert not list(uploads.rglob('*.deleted'))
+
+
+def test_referenced_again_cover_is_kept(uploads):
+    path = store_cover(io.BytesIO(b'cover'), 'png')
+    db.session.commit()
+    digest = release_cover(path)
+    db.session.commit()
+    # Uploaded again between the release and the collection
+    store_cover(io.BytesIO(b'cover'), 'png')
+    db.session.commit()
+
+    collect_cover(digest)
+    assert Cover.query.one().refcount == 1
+    assert os.path.exists(path)
+
+
+def test_failed_collection_keeps_the_file(uploads, monkeypatch):
+    path = store_cover(io.BytesIO(b'cover'), 'png')
+    db.session.commit()
+    digest = release_cover(path)
+    db.session.commit()
+
+    def fail():
+        raise OSError('database is locked')
+
+    monkeypatch.setattr(db.session, 'commit', fail)
+    with pytest.raises(OSError):
+        collect_cover(digest)
+    monkeypatch.undo()
+    db.session.rollback()
+    assert Cover.query.count() == 1
+    assert os.path.exists(path)
@@ -0,0 +1,120 @@
+import json
+
+import pytest
+
+from events import EventBus, EventRelay, TooManySubscribers, publish_after_commit
+from extensions import db, event_bus, event_relay
+from models import Book, ChangeEvent, User
+
+
+def test_subscribers_beyond_the_limit_are_refused():
+    bus = EventBus(max_subscribers=2)
+    first, _ = bus.subscribe()
+    bus.subscribe()
+    with pytest.raises(TooManySubscribers):
+        bus.subscribe()
+    # A closed stream makes room for the next one
+    bus.unsubscribe(first)
+    bus.subscribe()
+    assert bus.stats() == {'published': 0, 'subscribers': 2, 'refused': 1}
+
+
+def test_full_worker_answers_503(app):
+    user = User(name='Reader', city='Haifa', username='reader', password='x')
+    db.session.add(user)
+    db.session.commit()
+    for _ in range(app.config['EVENTS_MAX_SUBSCRIBERS']):
+        event_bus.subscribe()
+
+    response = app.test_client().get('/events', headers={'Authorization': f'Bearer {user.generate_token()}'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == str(app.config['EVENTS_RETRY_AFTER'])
+
+
+def received(subscription):
+    events = []
+    while (event := subscription.get(0)) is not None:
+        events.append(event)
+    return events
+
+
+@pytest.fixture
+def reader(app):
+    user = User(name='Reader', city='Haifa', username='reader', password='x')
+    db.session.add(user)
+    db.session.add(Book(name='Dune', author='Herbert', year_published=1965, book_type=1))
+    db.session.commit()
+    return user
+
+
+def test_book_event_is_written_like_get_books(app, reader):
+    event_relay.poll()
+    subscription, _ = event_bus.subscribe()
+    headers = {'Authorization': f'Bearer {reader.generate_token()}'}
+    client = app.test_client()
+    client.put('/books/1', data={'year_published': '1966', 'book_type': '2'}, headers=headers)
+
+    event_relay.poll()
+    event, = received(subscription)
+    listed, = client.get('/books', headers=headers).get_json()['books']
+    assert event.type == 'book.updated'
+    assert json.loads(event.data) == listed == {
+        'id': 1, 'name': 'Dune', 'author': 'Herbert', 'year_published': 1966, 'book_type': 2, 'customer_id': 'None', 'image': None
+    }
+
+
+def test_every_worker_relays_every_event(app, reader):
+    # Another worker: its own bus and relay over the same database
+    other_bus = EventBus()
+    other_relay = EventRelay(app, other_bus, 1000, 1)
+    event_relay.poll()
+    other_relay.poll()
+    subscription, _ = event_bus.subscribe()
+    other_subscription, _ = other_bus.subscribe()
+
+    app.test_client().post('/books/1/loan', headers={'Authorization': f'Bearer {reader.generate_token()}'})
+    event_relay.poll()
+    other_relay.poll()
+    assert [event.type for event in received(subscription)] == ['book.loaned']
+    event, = received(other_subscription)
+    assert event.type == 'book.loaned'
+    # Ids are the same everywhere, so a client may resume on any worker
+    publish_after_commit('book.deleted', {'id': 1})
+    db.session.commit()
+    other_relay.poll()
+    _, backlog = other_bus.subscribe(str(event.id))
+    assert [event.type for event in backlog] == ['book.deleted']
+
+
+def test_rolled_back_events_are_not_relayed(app):
+    event_relay.poll()
+    subscription, _ = event_bus.subscribe()
+    publish_after_commit('book.deleted', {'id': 1})
+    db.session.rollback()
+    event_relay.poll()
+    assert received(subscription) == []
+
+
+def test_late_committed_event_is_relayed(app):
+    # On PostgreSQL a transaction may commit after one that took a higher id
+    event_relay.poll()
+    subscription, _ = event_bus.subscribe()
+    db.session.add(ChangeEvent(id=2, type='book.deleted', data='{"id":2}'))
+    db.session.commit()
+    event_relay.poll()
+    db.session.add(ChangeEvent(id=1, type='book.deleted', data='{"id":1}'))
+    db.session.commit()
+    event_relay.poll()
+    assert [event.id for event in received(subscription)] == [2, 1]
+    _, backlog = event_bus.subscribe('2')
+    assert [event.id for event in backlog] == [1]
+
+
+def test_relay_keeps_only_the_history(app):
+    relay = EventRelay(app, EventBus(history=2), 2, 1)
+    relay.poll()
+    for i in range(4):
+        publish_after_commit('book.deleted', {'id': i})
+    db.session.commit()
+    relay.poll()
+    assert [event.id for event in db.session.scalars(db.select(ChangeEvent).order_by(ChangeEvent.id))] == [3, 4]
@@ -0,0 +1,52 @@
+from datetime import datetime
+
+import pytest
+
+from extensions import db
+from loans import checkout_books, overdue_stats, scan_overdue_loans
+from models import Book, Loan, User
+
+
+@pytest.fixture
+def reader(app):
+    user = User(name='Reader', city='Haifa', username='reader', password='x')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def add_books(count):
+    books = [Book(name=f'Book {i}', author='Someone', year_published=2000, book_type=1) for i in range(count)]
+    db.session.add_all(books)
+    db.session.commit()
+    return [book.id for book in books]
+
+
+def loan(user, book_ids, loan_date):
+    checkout_books(user.id, book_ids, loan_date)
+    db.session.commit()
+
+
+def test_deleting_a_loaned_book_closes_its_loan(app, reader):
+    book_id, = add_books(1)
+    loan(reader, [book_id], datetime(2024, 1, 1))
+
+    response = app.test_client().delete(f'/books/{book_id}')
+    assert response.status_code == 200
+    assert Loan.query.filter(Loan.return_date.is_(None)).count() == 0
+    assert db.session.get(Book, book_id) is None
+
+
+def test_scan_marks_overdue_loans_after_a_loaned_book_is_deleted(app, reader):
+    deleted, kept = add_books(2)
+    loan(reader, [deleted, kept], datetime(2024, 1, 1))
+    app.test_client().delete(f'/books/{deleted}')
+    # An open loan whose book is gone, as deleting a book used to leave
+    db.session.add(Loan(customer_id=reader.id, book_id=None, loan_date=datetime(2024, 1, 1), due_date=datetime(2024, 1, 2)))
+    db.session.commit()
+
+    marked = overdue_stats['marked_total']
+    scan_overdue_loans(app)
+    late = app.test_client().get('/books/return').get_json()['late_returns']
+    assert [row['book_name'] for row in late] == ['Book 1']
+    assert overdue_stats['marked_total'] == marked + 1
@@ -0,0 +1,22 @@
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from extensions import db, metrics
+
+
+def test_failed_statement_leaves_nothing_on_the_connection(app):
+    with db.engine.connect() as conn:
+        conn.exec_driver_sql('SELECT 1')
+        info = {key: list(value) if isinstance(value, list) else value for key, value in conn.info.items()}
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                conn.exec_driver_sql('SELECT * FROM no_such_table')
+            conn.rollback()
+        # Pooled connections live for the whole process; they must not grow
+        assert conn.info == info
+
+
+def test_statements_are_timed(app):
+    observed = metrics.query_latency.count
+    db.session.execute(db.text('SELECT 1'))
+    assert metrics.query_latency.count == observed + 1
@@ -0,0 +1,61 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from extensions import db
+from models import Book, Loan, OverdueLoan, User
+
+
+def seed_loans(count):
+    # `count` more overdue loans, each of its own book, held by a few new users
+    first = User.query.count()
+    users = [User(name=f'User {i}', city='Haifa', username=f'user{i}', password='x') for i in range(first, first + 3)]
+    db.session.add_all(users)
+    db.session.flush()
+    loan_date = datetime(2024, 1, 1)
+    for i in range(count):
+        user = users[i % len(users)]
+        book = Book(name=f'Book {first}-{i}', author='Someone', year_published=2000, book_type=1, customer_id=user.id)
+        db.session.add(book)
+        db.session.flush()
+        loan = Loan(customer_id=user.id, book_id=book.id, loan_date=loan_date, due_date=loan_date + timedelta(days=10))
+        db.session.add(loan)
+        db.session.flush()
+        db.session.add(OverdueLoan(loan_id=loan.id, book_id=book.id, customer_id=user.id,
+                                   loan_date=loan.loan_date, due_date=loan.due_date))
+    db.session.commit()
+
+
+@contextmanager
+def counted_statements():
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+
+
+def statements_for(client, path, key):
+    with counted_statements() as statements:
+        response = client.get(path)
+    assert response.status_code == 200
+    return len(statements), len(response.get_json()[key])
+
+
+@pytest.mark.parametrize('path, key', [('/loans', 'loans'), ('/books/return', 'late_returns')])
+def test_statements_do_not_grow_with_loans(app, path, key):
+    client = app.test_client()
+    seed_loans(5)
+    small = statements_for(client, path, key)
+    seed_loans(45)
+    large = statements_for(client, path, key)
+    # Both fit in one page, so the second response lists 10 times the loans
+    assert (small[1], large[1]) == (5, 50)
+    assert 0 < small[0] == large[0]
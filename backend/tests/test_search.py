@@ -0,0 +1,83 @@
+import pytest
+
+from extensions import db
+from models import Book
+from search import book_index, neighbourhood, one_typo
+
+
+TITLES = ['Dune', 'Emma', 'The Lord of the Rings', 'Made in America', 'Dome', 'Lords and Ladies', 'Gardens of the Moon']
+
+
+@pytest.fixture
+def books(app):
+    db.session.add_all([Book(name=name, author='Someone', year_published=2000, book_type=1) for name in TITLES])
+    db.session.commit()
+    return {book.name: book.id for book in Book.query.all()}
+
+
+def first_match(query):
+    ids, _ = book_index.search(db.session, query, 3)
+    return db.session.get(Book, ids[0]).name if ids else None
+
+
+@pytest.mark.parametrize('query, title', [
+    ('dume', 'Dune'),  # A wrong letter in the middle
+    ('dnue', 'Dune'),  # Two swapped letters
+    ('emna', 'Emma'),
+    ('lrod', 'The Lord of the Rings'),
+    ('duune', 'Dune'),  # A letter too many
+    ('gardns', 'Gardens of the Moon'),  # A letter missing, in a longer term
+])
+def test_single_typo_in_short_terms(books, query, title):
+    assert first_match(query) == title
+
+
+def test_exact_matches_come_first(books):
+    ids, _ = book_index.search(db.session, 'lord', 5)
+    assert {db.session.get(Book, book_id).name for book_id in ids[:2]} == {'The Lord of the Rings', 'Lords and Ladies'}
+
+
+def test_two_typos_do_not_match(books):
+    assert first_match('dxmx') is None
+
+
+def test_short_terms_match_the_start_of_the_name(books):
+    ids, _ = book_index.search(db.session, 'Do', 5)
+    assert [db.session.get(Book, book_id).name for book_id in ids] == ['Dome']
+
+
+def test_whole_word_typo_ranks_above_the_term_inside_a_word(books):
+    db.session.add_all([Book(name=f'Qdnueqe {i}', author='Someone', year_published=2000, book_type=1) for i in range(30)])
+    db.session.commit()
+    assert first_match('dnue') == 'Dune'
+
+
+def test_vocabulary_follows_inserts_and_updates(books):
+    book = db.session.get(Book, books['Emma'])
+    book.name = 'Persuasion'
+    db.session.add(Book(name='Middlemarch', author='Someone', year_published=1871, book_type=1))
+    db.session.commit()
+    assert first_match('persuaison') == 'Persuasion'
+    assert first_match('midlemarch') == 'Middlemarch'
+
+
+def single_typos(term, alphabet):
+    typos = {term[:i] + term[i + 1:] for i in range(len(term))}
+    typos |= {term[:i] + letter + term[i:] for i in range(len(term) + 1) for letter in alphabet}
+    typos |= {term[:i] + letter + term[i + 1:] for i in range(len(term)) for letter in alphabet}
+    typos |= {term[:i] + term[i + 1] + term[i] + term[i + 2:] for i in range(len(term) - 1)}
+    return typos - {term}
+
+
+def test_neighbourhoods_meet_for_every_single_typo():
+    for typo in single_typos('dune', 'abcdenuz'):
+        assert one_typo(typo, 'dune'), typo
+        assert neighbourhood(typo) & neighbourhood('dune'), typo
+
+
+def test_one_typo():
+    assert one_typo('dnue', 'dune')
+    assert one_typo('lord', 'lords')
+    assert not one_typo('dxmx', 'dune')
+    assert not one_typo('kitten', 'sitting')
+    assert not one_typo('abcd', 'bcde')  # Same variant 'bcd', but two edits apart
@@ -0,0 +1,27 @@
+import json
+
+import pytest
+
+from serializers import RowSerializer, orjson
+
+
+VALUES = [
+    {'name': 'Émile \x7f "quoted" \\ 1e16', 'year': 1862, 'rate': 0.25},
+    [1e16, 1e-7, 1.5e300, -2.5e-12, 123456789012345678.0, 0.1, -0.0, 1e22],
+    {'keys': {'b': 1, 'a': [None, True, False]}, 'text': 'e1 2e3 "x1e5"', 'emoji': '📚'},
+]
+
+
+@pytest.mark.skipif(orjson is None, reason='orjson is not installed')
+@pytest.mark.parametrize('value', VALUES)
+def test_orjson_writes_what_json_dumps_writes(app, value):
+    expected = json.dumps(value, separators=(',', ':'), ensure_ascii=app.json.ensure_ascii, sort_keys=app.json.sort_keys)
+    assert app.json.dumps(value, separators=(',', ':')) == expected
+    assert app.json.response(value).get_data(as_text=True) == expected + '\n'
+
+
+def test_row_serializer_picks_fields_by_column():
+    rows = [(1, 'Dune', None), (2, 'Emma', 3)]
+    serialize = RowSerializer(['name', 'customer_id'], ['id', 'name', 'customer_id'], {'customer_id': str})
+    assert serialize(rows) == [{'name': 'Dune', 'customer_id': 'None'}, {'name': 'Emma', 'customer_id': '3'}]
+    assert RowSerializer(['name'], ['id', 'name'])(rows) == [{'name': 'Dune'}, {'name': 'Emma'}]
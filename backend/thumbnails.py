@@ -0,0 +1,116 @@
+import hashlib
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+FORMATS = {'jpg': 'JPEG', 'jpeg': 'JPEG', 'png': 'PNG', 'gif': 'GIF'}
+
+
+class ThumbnailCache:
+    # Resized variants of uploaded images, rendered in a thread pool (Pillow
+    # releases the GIL while decoding, resizing and encoding) and kept on disk.
+    # The folder is held under max_bytes by evicting the least recently used
+    # files; a hit refreshes the file's mtime, which is the LRU clock.
+
+    def __init__(self, folder, max_bytes=256 * 1024 * 1024, workers=2, quality=80):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.quality = quality
+        self._executor = None
+        self._pending = {}
+        self._size = None
+        self._lock = threading.Lock()
+
+    def key(self, source, width, height):
+        # Changes whenever the source file is replaced, so a variant is never stale
+        stat = os.stat(source)
+        return hashlib.sha256(f'{source}:{stat.st_mtime_ns}:{stat.st_size}:{width}x{height}:{self.quality}'.encode()).hexdigest()
+
+    def get(self, source, width, height, timeout=None):
+        # Path of the variant of `source` fitting in width x height, rendering it first if needed
+        key = self.key(source, width, height)
+        extension = source.rsplit('.', 1)[1].lower()
+        path = os.path.join(self.folder, key[:2], f'{key}.{extension}')
+        if os.path.exists(path):
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+            else:
+                return path
+
+        with self._lock:
+            # Concurrent requests for the same variant share one render
+            future = self._pending.get(path)
+            if future is None:
+                future = self._get_executor().submit(self._render, source, path, width, height)
+                self._pending[path] = future
+                future.add_done_callback(lambda _: self._pending.pop(path, None))
+        return future.result(timeout=timeout)
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='thumbnail')
+        return self._executor
+
+    def _render(self, source, path, width, height):
+        # Imported on first use: most workers never render a thumbnail
+        from PIL import Image
+
+        image_format = FORMATS[path.rsplit('.', 1)[1]]
+        with Image.open(source) as image:
+            image.thumbnail((width or image.width, height or image.height))
+            if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.render-')
+            with os.fdopen(fd, 'wb') as out:
+                if image_format == 'JPEG':
+                    image.save(out, image_format, quality=self.quality, optimize=True, progressive=True)
+                else:
+                    image.save(out, image_format, optimize=True)
+            os.chmod(tmp_path, 0o644)  # mkstemp's 0600 would keep a front proxy from reading it
+            os.replace(tmp_path, path)
+
+        self._account(os.path.getsize(path))
+        return path
+
+    def _account(self, added):
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._files())
+            else:
+                self._size += added
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _files(self):
+        for directory, _, names in os.walk(self.folder):
+            for name in names:
+                if name.startswith('.'):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def _evict(self):
+        # Drop the least recently used variants until the cache is 10% under budget,
+        # so eviction does not run again on every render
+        files = sorted(self._files(), key=lambda file: file[2])
+        self._size = sum(size for _, size, _ in files)
+        target = self.max_bytes * 0.9
+        for path, size, _ in files:
+            if self._size <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._size -= size
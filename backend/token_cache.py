@@ -0,0 +1,57 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+
+# What login_required keeps about the caller once the token has been verified
+Principal = namedtuple('Principal', ['id', 'is_admin'])
+
+
+class TokenCache:
+    # Bounded LRU of verified token -> Principal. An entry lives for `ttl`
+    # seconds or until the token's own `exp`, whichever comes first, so an
+    # expired token is always decoded again (and rejected) by jwt.decode.
+    # The cache is per process: entries removed with invalidate_user() in one
+    # worker stay valid in the others for at most `ttl` seconds.
+
+    def __init__(self, maxsize=10000, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._entries[token]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, token, principal, exp):
+        expires_at = min(exp, time.time() + self.ttl)
+        with self._lock:
+            self._entries[token] = (principal, expires_at)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for token in [token for token, (principal, _) in self._entries.items() if principal.id == user_id]:
+                del self._entries[token]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
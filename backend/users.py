@@ -0,0 +1,95 @@
+from datetime import datetime
+
+from flask import Blueprint, jsonify, request
+
+from books import book_event
+from catalog import bump_catalog_version
+from events import publish_after_commit
+from extensions import db, token_cache
+from loans import checkin_books
+from models import Book, Loan, User
+from pagination import search_args, search_results
+from search import user_index
+from serializers import RowSerializer
+
+
+bp = Blueprint('users', __name__)
+
+
+user_rows = RowSerializer(['id', 'name', 'city', 'age', 'username'])
+
+
+@bp.route('/users', methods=['GET'])
+def get_users():
+    users = db.session.execute(db.select(User.id, User.name, User.city, User.age, User.username).order_by(User.id)).all()
+    return jsonify({'users': user_rows(users)})
+
+# Define route to delete a user
+@bp.route('/users/<int:user_id>', methods=['DELETE'])
+def delete_user(user_id):
+    try:
+        # Query the user by ID
+        user = User.query.get(user_id)
+        if user:
+            # Return the books the user still has out first: an open loan
+            # left without a customer would keep its book from being loaned
+            # again (uq_loan_open_book)
+            held = db.session.scalars(
+                db.select(Loan.book_id).where(Loan.customer_id == user_id, Loan.return_date.is_(None))
+            ).all()
+            if held:
+                checkin_books(user_id, held, datetime.utcnow())
+            # Books still marked as the user's without an open loan are freed
+            # here rather than by the ORM, so cached catalog reads see it
+            freed = Book.query.filter_by(customer_id=user_id).all()
+            for book in freed:
+                book.customer_id = None
+                publish_after_commit('book.updated', book_event(book))
+            if freed:
+                bump_catalog_version()
+            # Delete the user
+            db.session.delete(user)
+            db.session.commit()
+            token_cache.invalidate_user(user_id)
+            return jsonify({'message': 'User deleted successfully'}), 200
+        else:
+            return jsonify({'error': 'User not found'}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route('/users/find', methods=['GET'])
+def find_user_by_name():
+    try:
+        # Ranked, typo-tolerant search over name and city
+        if 'q' in request.args:
+            try:
+                query, limit, offset = search_args()
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            users, next_offset = search_results(user_index, User, query, limit, offset)
+            user_info = [{'id': user.id, 'name': user.name, 'city': user.city, 'age': user.age, 'username': user.username} for user in users]
+            return jsonify({'users': user_info, 'next_offset': next_offset}), 200
+
+        user_name = request.args.get('name')
+        if not user_name:
+            return jsonify({'error': 'User name parameter is missing'}), 400
+            
+        # Query the database to find the user by name
+        user = User.query.filter_by(name=user_name).first()
+
+        if user:
+            # User found, return their details
+            user_data = {
+                'id': user.id,
+                'name': user.name,
+                'city': user.city,
+                'age': user.age,
+                'username': user.username
+            }
+            return jsonify(user_data), 200
+        else:
+            # User not found
+            return jsonify({'error': 'User not found'}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
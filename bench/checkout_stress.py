@@ -0,0 +1,147 @@
+"""Hammer a handful of books with concurrent loan and return requests.
+
+Every process plays a different user and runs its own copy of the app
+against one shared SQLite file, like gunicorn workers do. Afterwards the
+loan table is checked for double loans: a book with more than one open
+loan, or whose customer_id disagrees with its open loan.
+
+    python bench/checkout_stress.py --processes 8 --books 4 --duration 10
+
+The backend tree is copied to a temporary directory first, so the real
+database is never touched. Exits with status 1 if an invariant is broken.
+--backend runs it against another tree, e.g. the baseline:
+
+    git worktree add /tmp/baseline <revision>
+    python bench/checkout_stress.py --backend /tmp/baseline/backend
+"""
+import argparse
+import multiprocessing
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from common import BACKEND, copy_backend, load_app
+
+
+CONFIG = {'RATE_LIMIT': False}
+
+
+def schema():
+    # db and the models; trees from before they were split out of app.py
+    # define them there and have no migrations
+    try:
+        from extensions import db
+        from models import Book, Loan, User
+    except ImportError:
+        from app import Book, Loan, User, db
+    return db, Book, Loan, User
+
+
+def setup(workdir, users, books):
+    app = load_app(workdir, CONFIG)
+    db, Book, _, User = schema()
+    try:
+        from extensions import upgrade_database
+    except ImportError:
+        with app.app_context():
+            db.create_all()
+    else:
+        upgrade_database(app)
+    with app.app_context():
+        for i in range(users):
+            db.session.add(User(name=f'stress {i}', city='bench', username=f'stress{i}', password='x'))
+        for i in range(books):
+            db.session.add(Book(name=f'stress {i}', author='bench', year_published=2000, book_type=1))
+        db.session.commit()
+        return [user.generate_token() for user in User.query.order_by(User.id).all()]
+
+
+def run_worker(workdir, token, books, duration, results):
+    client = load_app(workdir, CONFIG).test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+    counts = {'loaned': 0, 'returned': 0, 'rejected': 0, 'errors': 0, 'requests': 0}
+    held = set()
+    started = time.perf_counter()
+    while time.perf_counter() - started < duration:
+        # Return what this user holds half of the time, otherwise try to loan any book
+        if held and random.random() < 0.5:
+            book_id, action = random.choice(sorted(held)), 'return'
+        else:
+            book_id, action = random.randint(1, books), 'loan'
+        response = client.post(f'/books/{book_id}/{action}', headers=headers)
+        counts['requests'] += 1
+        if response.status_code == 200:
+            counts['loaned' if action == 'loan' else 'returned'] += 1
+            (held.add if action == 'loan' else held.discard)(book_id)
+        elif response.status_code < 500:
+            counts['rejected'] += 1
+        else:
+            counts['errors'] += 1
+    counts['elapsed'] = time.perf_counter() - started
+    results.put(counts)
+
+
+def check(workdir):
+    app = load_app(workdir, CONFIG)
+    _, Book, Loan, _ = schema()
+    problems = []
+    with app.app_context():
+        for book in Book.query.all():
+            open_loans = Loan.query.filter_by(book_id=book.id, return_date=None).all()
+            if len(open_loans) > 1:
+                problems.append(f'book {book.id} has {len(open_loans)} open loans')
+            holder = open_loans[0].customer_id if open_loans else None
+            if book.customer_id != holder:
+                problems.append(f'book {book.id} is held by {book.customer_id} but its open loan is for {holder}')
+        total_loans = Loan.query.count()
+    return problems, total_loans
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--backend', default=BACKEND)
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--books', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10, help='seconds')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='checkout-stress-')
+    try:
+        copy_backend(args.backend, workdir)
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(1) as pool:
+            tokens = pool.apply(setup, (workdir, args.processes, args.books))
+
+        results = context.Queue()
+        workers = [context.Process(target=run_worker, args=(workdir, token, args.books, args.duration, results)) for token in tokens]
+        for worker in workers:
+            worker.start()
+        totals = {}
+        for _ in workers:
+            for key, value in results.get().items():
+                totals[key] = totals.get(key, 0) + value
+        for worker in workers:
+            worker.join()
+        elapsed = totals['elapsed'] / len(workers)
+
+        with context.Pool(1) as pool:
+            problems, total_loans = pool.apply(check, (workdir,))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{totals['requests']} requests in {elapsed:.1f}s: {totals['requests'] / elapsed:.0f} req/s, "
+          f"{(totals['loaned'] + totals['returned']) / elapsed:.0f} successful loans+returns/s")
+    print(f"loaned {totals['loaned']}, returned {totals['returned']}, rejected {totals['rejected']}, server errors {totals['errors']}")
+    if total_loans != totals['loaned']:
+        problems.append(f"{totals['loaned']} successful loans but {total_loans} loan rows")
+    for problem in problems:
+        print('FAIL:', problem)
+    if not problems:
+        print('OK: no double loans')
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == '__main__':
+    main()
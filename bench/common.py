@@ -0,0 +1,74 @@
+"""Helpers shared by the benchmark scripts."""
+import math
+import os
+import shutil
+import subprocess
+import sys
+
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+
+
+def copy_backend(backend, workdir):
+    # A private copy of the backend tree, without the database and uploads
+    shutil.copytree(backend, workdir, dirs_exist_ok=True,
+                    ignore=shutil.ignore_patterns('*.db', '*.db-wal', '*.db-shm', 'uploads', 'thumbnails', '__pycache__'))
+
+
+def load_app(workdir, config=None):
+    # The app of the backend copy in workdir; its modules become importable.
+    # Trees from before create_app() (such as the baseline) have a
+    # module-level app, which gets the config instead
+    os.chdir(workdir)
+    sys.path.insert(0, workdir)
+    import app as module
+    if not hasattr(module, 'create_app'):
+        module.app.config.update(config or {})
+        return module.app
+    return module.create_app(config)
+
+
+def percentile(values, q):
+    # Nearest-rank percentile of an already sorted list
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, math.ceil(q / 100 * len(values)) - 1))]
+
+
+def summarize(latencies):
+    # Latency summary in milliseconds
+    latencies = sorted(latencies)
+    return {
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3) if latencies else None,
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else None,
+    }
+
+
+def rss_kb(pid):
+    # Resident set size of a process, 0 once it is gone
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def children(pid):
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as listing:
+            return [int(child) for child in listing.read().split()]
+    except OSError:
+        return []
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,58 @@
+"""Compare two benchmark result files and flag regressions.
+
+    python bench/compare.py bench/results/abc1234.json bench/results/def5678.json --threshold 10
+
+Prints the change of every HTTP p95 latency and throughput and every
+micro-benchmark mean between the baseline (first file) and the candidate.
+Exits with status 1 when anything got worse by more than --threshold
+percent.
+"""
+import argparse
+import json
+import sys
+
+
+# (section, metric, True when higher is better)
+METRICS = [
+    ('http', 'p95_ms', False),
+    ('http', 'throughput', True),
+    ('micro', 'mean_us', False),
+]
+
+
+def compare(baseline, candidate, threshold):
+    rows, regressions = [], []
+    for section, metric, higher_is_better in METRICS:
+        for name, result in candidate.get(section, {}).items():
+            before = baseline.get(section, {}).get(name, {}).get(metric)
+            after = result.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before * 100
+            worse = -change if higher_is_better else change
+            rows.append((f'{section}: {name}', metric, before, after, change, worse > threshold))
+            if worse > threshold:
+                regressions.append(rows[-1])
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=10, help='percent')
+    args = parser.parse_args()
+    with open(args.baseline) as baseline_file, open(args.candidate) as candidate_file:
+        baseline, candidate = json.load(baseline_file), json.load(candidate_file)
+
+    print(f"baseline {baseline.get('revision')}  candidate {candidate.get('revision')}")
+    rows, regressions = compare(baseline, candidate, args.threshold)
+    for name, metric, before, after, change, regressed in rows:
+        print(f"{name:44} {metric:10} {before:12.2f} -> {after:12.2f}  {change:+7.1f}%{'  REGRESSION' if regressed else ''}")
+    if regressions:
+        print(f'{len(regressions)} regressions over {args.threshold}%')
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
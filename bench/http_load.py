@@ -0,0 +1,272 @@
+"""Drive every route of the app over HTTP against a local gunicorn.
+
+    python bench/http_load.py --workdir /tmp/library-bench --concurrency 8 --duration 5
+
+--workdir must have been seeded with bench/seed.py. Each scenario runs for
+--duration seconds with --concurrency client threads, one user per thread,
+and reports p50/p95/p99 latency, throughput, errors and the peak RSS of
+all gunicorn processes. The server log, including slow queries, goes to
+gunicorn.log in the workdir. Scenarios that write work on their own id ranges
+so they can run in any order; loans are returned by the return scenarios.
+"""
+import argparse
+import base64
+import itertools
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+import requests
+
+from common import children, rss_kb, summarize
+
+
+WORDS = ['river', 'night', 'garden', 'stone', 'winter', 'silver', 'shadow', 'harbor', 'letter', 'forest']
+
+
+def cursor(book_id):
+    return base64.urlsafe_b64encode(json.dumps({'id': book_id}).encode()).decode()
+
+
+class Context:
+    # What the scenarios know about the seeded data, plus per-client state
+    def __init__(self, base, info, concurrency):
+        self.base = base
+        self.info = info
+        self.admin = {'Authorization': f"Bearer {info['tokens'][0]}"}
+        self.headers = [{'Authorization': f"Bearer {token}"} for token in info['tokens'][:concurrency]]
+        self.held = [set() for _ in range(concurrency)]
+        # Books nobody holds, split between the clients for the loan scenarios
+        free = list(range(info['open_loans'] + 1, info['books'] + 1))
+        self.free = [free[i::concurrency] for i in range(concurrency)]
+        self.spare_books = itertools.count(info['books'] + 1)
+        self.spare_users = itertools.count(info['users'] + 1)
+        self.lock = threading.Lock()
+
+    def next_spare(self, counter, limit):
+        with self.lock:
+            value = next(counter)
+        return value if value <= limit else None
+
+
+def loan_one(session, ctx, client):
+    book_id = random.choice(ctx.free[client])
+    response = session.post(f'{ctx.base}/books/{book_id}/loan', headers=ctx.headers[client])
+    if response.status_code == 200:
+        ctx.held[client].add(book_id)
+    return response
+
+
+def return_one(session, ctx, client):
+    if not ctx.held[client]:
+        return None
+    response = session.post(f'{ctx.base}/books/{ctx.held[client].pop()}/return', headers=ctx.headers[client])
+    return response
+
+
+def loan_batch(session, ctx, client):
+    book_ids = random.sample(ctx.free[client], 10)
+    response = session.post(f'{ctx.base}/loans/batch', headers=ctx.headers[client], json={'book_ids': book_ids})
+    if response.status_code == 200:
+        ctx.held[client].update(item['book_id'] for item in response.json()['results'] if item['success'])
+    return response
+
+
+def return_batch(session, ctx, client):
+    if not ctx.held[client]:
+        return None
+    book_ids = [ctx.held[client].pop() for _ in range(min(10, len(ctx.held[client])))]
+    return session.post(f'{ctx.base}/returns/batch', headers=ctx.headers[client], json={'book_ids': book_ids})
+
+
+def delete_book(session, ctx, client):
+    book_id = ctx.next_spare(ctx.spare_books, ctx.info['books'] + ctx.info['spare'])
+    return session.delete(f'{ctx.base}/books/{book_id}') if book_id else None
+
+
+def delete_user(session, ctx, client):
+    user_id = ctx.next_spare(ctx.spare_users, ctx.info['users'] + ctx.info['spare'])
+    return session.delete(f'{ctx.base}/users/{user_id}', headers=ctx.admin) if user_id else None
+
+
+def bulk_import(session, ctx, client):
+    rows = '\n'.join(f'imported {uuid.uuid4().hex[:8]},bench,2000,1' for _ in range(100))
+    return session.post(f'{ctx.base}/books/bulk', headers=ctx.headers[client],
+                        files={'file': ('books.csv', 'name,author,year_published,book_type\n' + rows)})
+
+
+def add_book(session, ctx, client):
+    with open(ctx.info['cover_path'], 'rb') as image:
+        return session.post(f'{ctx.base}/books', headers=ctx.headers[client], files={'image': ('cover.png', image)},
+                            data={'name': 'added book', 'author': 'bench', 'year_published': '2001', 'book_type': '2'})
+
+
+def events(session, ctx, client):
+    # Connect, read the first line and hang up
+    response = session.get(f"{ctx.base}/events?token={ctx.info['tokens'][client]}", stream=True)
+    next(response.iter_lines())
+    response.close()
+    return response
+
+
+def random_book(ctx):
+    return random.randint(1, ctx.info['books'])
+
+
+# (name, request) in the order they run. A request returns a Response, or
+# None when the scenario has nothing left to do for that client.
+SCENARIOS = [
+    ('GET /books', lambda s, ctx, c: s.get(f'{ctx.base}/books?limit=100&cursor={cursor(random_book(ctx))}', headers=ctx.headers[c])),
+    ('GET /books?fields', lambda s, ctx, c: s.get(f'{ctx.base}/books?limit=100&fields=id,name&available=true', headers=ctx.headers[c])),
+    ('GET /books/:id', lambda s, ctx, c: s.get(f'{ctx.base}/books/{random_book(ctx)}', headers=ctx.headers[c])),
+    ('GET /books/find?q', lambda s, ctx, c: s.get(f'{ctx.base}/books/find?q={random.choice(WORDS)} {random.choice(WORDS)}&limit=20')),
+    ('GET /books/find?name', lambda s, ctx, c: s.get(f'{ctx.base}/books/find?name=cover book')),
+    ('GET /users', lambda s, ctx, c: s.get(f'{ctx.base}/users')),
+    ('GET /users/find?q', lambda s, ctx, c: s.get(f'{ctx.base}/users/find?q={random.choice(WORDS)}&limit=20')),
+    ('GET /loans', lambda s, ctx, c: s.get(f'{ctx.base}/loans?limit=100&cursor={cursor(random_book(ctx))}')),
+    ('GET /loans?history', lambda s, ctx, c: s.get(f'{ctx.base}/loans?history=1&limit=100&cursor={cursor(random_book(ctx))}')),
+    ('GET /loans?stream', lambda s, ctx, c: s.get(f'{ctx.base}/loans?stream=1')),
+    ('GET /books/return', lambda s, ctx, c: s.get(f'{ctx.base}/books/return?limit=100')),
+    ('GET /uploads/:path', lambda s, ctx, c: s.get(f"{ctx.base}/{ctx.info['cover']}")),
+    ('GET /uploads/:path?w', lambda s, ctx, c: s.get(f"{ctx.base}/{ctx.info['cover']}?w=200")),
+    ('GET /stats', lambda s, ctx, c: s.get(f'{ctx.base}/stats', headers=ctx.headers[c])),
+    ('GET /metrics', lambda s, ctx, c: s.get(f'{ctx.base}/metrics')),
+    ('GET /events', events),
+    ('POST /login', lambda s, ctx, c: s.post(f'{ctx.base}/login', json={'username': f'bench{c + 1}', 'password': 'bench'})),
+    ('POST /register', lambda s, ctx, c: s.post(f'{ctx.base}/register', json={
+        'name': 'new user', 'city': 'Haifa', 'age': 30, 'username': uuid.uuid4().hex, 'password': 'bench'})),
+    ('POST /logout', lambda s, ctx, c: s.post(f'{ctx.base}/logout')),
+    ('POST /books', add_book),
+    ('PUT /books/:id', lambda s, ctx, c: s.put(f'{ctx.base}/books/{random_book(ctx)}', headers=ctx.headers[c],
+                                                 data={'name': f'{random.choice(WORDS)} edition'})),
+    ('POST /books/bulk', bulk_import),
+    ('POST /books/:id/loan', loan_one),
+    ('POST /books/:id/return', return_one),
+    ('POST /loans/batch', loan_batch),
+    ('POST /returns/batch', return_batch),
+    ('DELETE /books/:id', delete_book),
+    ('DELETE /users/:id', delete_user),
+]
+
+
+def run_scenario(name, request, ctx, concurrency, duration, pids):
+    latencies = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+    stop = time.perf_counter() + duration
+    peak = [0]
+
+    def client(index):
+        session = requests.Session()
+        while time.perf_counter() < stop:
+            sent = time.perf_counter()
+            try:
+                response = request(session, ctx, index)
+            except requests.RequestException:
+                errors[index] += 1
+                continue
+            if response is None:
+                break
+            latencies[index].append(time.perf_counter() - sent)
+            if response.status_code >= 500:
+                errors[index] += 1
+
+    def sample():
+        while time.perf_counter() < stop:
+            peak[0] = max(peak[0], sum(rss_kb(pid) for pid in pids()))
+            time.sleep(0.1)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)] + [threading.Thread(target=sample)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    flat = [latency for client_latencies in latencies for latency in client_latencies]
+    result = {'requests': len(flat), 'errors': sum(errors), 'throughput': round(len(flat) / elapsed, 1)}
+    result.update(summarize(flat))
+    result['peak_rss_mb'] = round(peak[0] / 1024, 1)
+    return result
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def start_gunicorn(workdir, workers, threads, port):
+    # A disconnected /events client holds its thread until the next keepalive
+    # is written, so keep that short or the events scenario starves the rest.
+    # The clients share a few tokens and one address: no rate limits here.
+    env = dict(os.environ, FLASK_EVENTS_KEEPALIVE='1', FLASK_RATE_LIMIT='false')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--chdir', workdir, '--workers', str(workers), '--threads', str(threads),
+         '--worker-class', 'gthread', '--bind', f'127.0.0.1:{port}', '--log-level', 'warning',
+         '--error-logfile', os.path.join(workdir, 'gunicorn.log'), 'wsgi:app'],
+        cwd=workdir, env=env
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            requests.get(f'http://127.0.0.1:{port}/metrics', timeout=1)
+            return process
+        except requests.RequestException:
+            if process.poll() is not None:
+                raise RuntimeError('gunicorn exited during startup')
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError('gunicorn did not start')
+
+
+def run(workdir, concurrency=8, duration=5, workers=2, threads=4, only=None):
+    with open(os.path.join(workdir, 'seed.json')) as seed_file:
+        info = json.load(seed_file)
+    info['cover_path'] = os.path.join(workdir, info['cover'])
+    if concurrency > len(info['tokens']):
+        raise ValueError(f"seed.json has tokens for {len(info['tokens'])} clients, re-seed with --clients {concurrency}")
+
+    port = free_port()
+    server = start_gunicorn(workdir, workers, threads, port)
+    ctx = Context(f'http://127.0.0.1:{port}', info, concurrency)
+    results = {}
+    try:
+        for name, request in SCENARIOS:
+            if only and name not in only:
+                continue
+            results[name] = run_scenario(name, request, ctx, concurrency, duration, lambda: [server.pid] + children(server.pid))
+            print(f"{name:24} {results[name]['throughput']:8.1f} req/s  p50 {results[name]['p50_ms']} ms  "
+                  f"p95 {results[name]['p95_ms']} ms  p99 {results[name]['p99_ms']} ms  errors {results[name]['errors']}  "
+                  f"rss {results[name]['peak_rss_mb']} MB", flush=True)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--workdir', required=True)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=5, help='seconds per scenario')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--threads', type=int, default=4, help='threads per gunicorn worker')
+    parser.add_argument('--scenario', action='append', help='run only this scenario, may be repeated')
+    parser.add_argument('--output', help='write the results as JSON')
+    args = parser.parse_args()
+    results = run(args.workdir, args.concurrency, args.duration, args.workers, args.threads, args.scenario)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({'http': results}, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""Micro-benchmarks of hot functions, run in-process against a seeded workdir.
+
+    python bench/micro.py --workdir /tmp/library-bench --seconds 2
+
+Covers token checking in login_required (cache hit and miss), JSON
+serialization of 1000-book and 1000-loan pages, the GET /books
+and GET /loans handlers without HTTP, search, the overdue scan and
+rate limiter admission with in-process and SQLite buckets.
+"""
+import argparse
+import json
+import multiprocessing
+import time
+
+from common import load_app, percentile
+
+
+def measure(function, seconds):
+    # Call function repeatedly for about `seconds`; per-call timings in microseconds
+    timings = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline or len(timings) < 5:
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return {
+        'calls': len(timings),
+        'ops_per_sec': round(len(timings) / sum(timings), 1),
+        'mean_us': round(sum(timings) / len(timings) * 1e6, 2),
+        'p50_us': round(percentile(timings, 50) * 1e6, 2),
+        'p95_us': round(percentile(timings, 95) * 1e6, 2),
+    }
+
+
+def benchmarks(app, info):
+    from auth import login_required
+    from books import BOOK_FIELDS
+    from extensions import db, token_cache
+    from flask import jsonify
+    from loans import loan_rows, scan_overdue_loans
+    from models import Loan
+    from ratelimit import MemoryBuckets, RateLimiter, SQLiteBuckets
+    from search import book_index
+    from serializers import legacy_dates
+
+    token = info['tokens'][0]
+    headers = {'Authorization': f'Bearer {token}'}
+    client = app.test_client()
+    protected = login_required(lambda: None)
+
+    def token_hit():
+        with app.test_request_context(headers=headers):
+            protected()
+
+    def token_miss():
+        with app.app_context():
+            token_cache.clear()
+        token_hit()
+
+    with app.app_context():
+        books = [dict(row._mapping) for row in db.session.execute(db.select(*BOOK_FIELDS.values()).limit(1000))]
+        loans = db.session.execute(db.select(
+            Loan.id, Loan.customer_id, Loan.book_id, Loan.loan_date, Loan.return_date,
+            Loan.due_date.label('expected_return_date')
+        ).limit(1000)).all()
+
+    def serialize_books():
+        with app.app_context():
+            jsonify({'books': books, 'next': None}).get_data()
+
+    def serialize_loans():
+        with app.app_context():
+            jsonify({'loans': loan_rows(loans, legacy_dates())}).get_data()
+
+    def search():
+        with app.app_context():
+            book_index.search(db.session, 'river garden', 20)
+
+    def overdue_scan():
+        scan_overdue_loans(app)
+
+    # Buckets that never run dry, so that every call takes the admitting path
+    keys = [f'user:{i}' for i in range(1000)]
+
+    def admit(limiter):
+        key = keys[time.perf_counter_ns() % len(keys)]
+        limiter.release(limiter.admit(key, 'view', time.time()).slot)
+
+    memory_limiter = RateLimiter(MemoryBuckets(1e9, 1e9), {}, {'view': 4})
+    sqlite_limiter = RateLimiter(SQLiteBuckets('ratelimit-bench.db', 1e9, 1e9), {}, {'view': 4})
+
+    return [
+        ('login_required token cache hit', token_hit),
+        ('login_required token cache miss', token_miss),
+        ('jsonify 1000 books', serialize_books),
+        ('serialize 1000 loans', serialize_loans),
+        ('GET /books limit=1000 handler', lambda: client.get('/books?limit=1000&x=' + str(time.perf_counter_ns()), headers=headers)),
+        ('GET /loans limit=1000 handler', lambda: client.get('/loans?limit=1000')),
+        ('book search', search),
+        ('overdue scan', overdue_scan),
+        ('rate limit admit, memory', lambda: admit(memory_limiter)),
+        ('rate limit admit, sqlite', lambda: admit(sqlite_limiter)),
+    ]
+
+
+def run_in_process(workdir, seconds, only):
+    app = load_app(workdir, {'OVERDUE_SCHEDULER': 'off', 'RATE_LIMIT': False})
+    with open('seed.json') as seed_file:
+        info = json.load(seed_file)
+    results = {}
+    for name, function in benchmarks(app, info):
+        if only and name not in only:
+            continue
+        function()  # Warm up
+        results[name] = measure(function, seconds)
+    return results
+
+
+def run(workdir, seconds=2, only=None):
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1) as pool:
+        results = pool.apply(run_in_process, (workdir, seconds, only))
+    for name, result in results.items():
+        print(f"{name:34} {result['ops_per_sec']:10.1f} ops/s  mean {result['mean_us']} us  p95 {result['p95_us']} us", flush=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--workdir', required=True)
+    parser.add_argument('--seconds', type=float, default=2, help='per benchmark')
+    parser.add_argument('--benchmark', action='append', help='run only this benchmark, may be repeated')
+    parser.add_argument('--output', help='write the results as JSON')
+    args = parser.parse_args()
+    results = run(args.workdir, args.seconds, args.benchmark)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({'micro': results}, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Seed a database, run the HTTP and micro-benchmarks and save the results.
+
+    python bench/run.py --size small
+    python bench/run.py --books 1000000 --users 100000 --loans 1000000 --duration 10
+
+The results are written as JSON to bench/results/<git revision>.json
+(or --output), ready for bench/compare.py. Sizes:
+    small    10k books,  1k users,   10k loans
+    medium  100k books, 10k users,  100k loans
+    large     1M books, 100k users,   1M loans
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+
+import http_load
+import micro
+from common import BACKEND, git_revision
+from seed import seed
+
+
+SIZES = {
+    'small': (10000, 1000, 10000),
+    'medium': (100000, 10000, 100000),
+    'large': (1000000, 100000, 1000000),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--backend', default=BACKEND)
+    parser.add_argument('--size', choices=sorted(SIZES), default='small')
+    parser.add_argument('--books', type=int)
+    parser.add_argument('--users', type=int)
+    parser.add_argument('--loans', type=int)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=5, help='seconds per HTTP scenario')
+    parser.add_argument('--micro-seconds', type=float, default=2, help='seconds per micro-benchmark')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--threads', type=int, default=4, help='threads per gunicorn worker')
+    parser.add_argument('--scenario', action='append', help='run only this HTTP scenario, may be repeated')
+    parser.add_argument('--skip-http', action='store_true')
+    parser.add_argument('--skip-micro', action='store_true')
+    parser.add_argument('--workdir', help='keep the seeded tree here instead of a temporary directory')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    books, users, loans = SIZES[args.size]
+    books, users, loans = args.books or books, args.users or users, args.loans or loans
+    revision = git_revision()
+    workdir = args.workdir or tempfile.mkdtemp(prefix='library-bench-')
+    results = {
+        'revision': revision,
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'config': {'books': books, 'users': users, 'loans': loans, 'concurrency': args.concurrency, 'duration': args.duration,
+                   'workers': args.workers, 'threads': args.threads},
+    }
+    try:
+        info = seed(workdir, books, users, loans, clients=max(args.concurrency, 1), backend=args.backend)
+        results['seed_seconds'] = info['seconds']
+        print(f"Seeded {books} books, {users} users and {loans} loans in {info['seconds']}s", flush=True)
+        # The micro-benchmarks read the database as seeded, so they run first
+        if not args.skip_micro:
+            results['micro'] = micro.run(workdir, args.micro_seconds)
+        if not args.skip_http:
+            results['http'] = http_load.run(workdir, args.concurrency, args.duration, args.workers, args.threads, args.scenario)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = args.output or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results', f'{revision or "results"}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f'Results written to {output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""Search latency on a large catalog, with a budget.
+
+    python bench/search_scale.py --workdir /tmp/library-search --books 1000000 --budget-ms 10
+
+The backend is copied into --workdir and --books books are inserted there
+through the app, so the search triggers run as they would in production.
+Titles are drawn from a vocabulary of --words made-up words with a Zipf
+distribution: a few words are in many titles, most in a handful. A few
+real titles and titles that contain a typo of them inside a longer word
+(e.g. 'Qdnueqe' for 'Dune') are mixed in. Exact, prefix, misspelled and
+unknown queries are then timed in-process, and misspelled ones must find
+the title they were meant for. Exits with status 1 when the p95 of a
+query is over --budget-ms or a title is not found. An existing workdir
+with as many books is reused.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+from common import BACKEND, copy_backend, load_app, summarize
+
+
+CHUNK = 50000
+SYLLABLES = ['ka', 'lo', 'mi', 'ren', 'sa', 'tor', 'vel', 'an', 'dri', 'es', 'gal', 'hu', 'in', 'jor', 'ke', 'mar',
+             'nu', 'or', 'pel', 'qui', 'ra', 'sel', 'tin', 'ul', 'van', 'wy', 'xa', 'yor', 'zen', 'bri']
+TITLES = ['Dune', 'Emma', 'The Lord of the Rings', 'Gardens of the Moon', 'Middlemarch', 'Persuasion']
+# (query, title it must find first); None for queries only timed
+QUERIES = [
+    ('dune', 'Dune'),
+    ('lord rings', 'The Lord of the Rings'),
+    ('gard', None),
+    ('dnue', 'Dune'),
+    ('emna', 'Emma'),
+    ('lrod rigns', 'The Lord of the Rings'),
+    ('gardns moon', 'Gardens of the Moon'),
+    ('midlemarch', 'Middlemarch'),
+    ('zqxw', None),
+    ('du', None),
+]
+
+
+def vocabulary(count, rng):
+    words = set()
+    while len(words) < count:
+        words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def build(workdir, books, words, seed):
+    rng = random.Random(seed)
+    app = load_app(workdir, {'OVERDUE_SCHEDULER': 'off', 'RATE_LIMIT': False})
+    from extensions import db, upgrade_database
+    from models import Book
+    upgrade_database(app)
+    started = time.perf_counter()
+    with app.app_context():
+        vocab = vocabulary(words, rng)
+        weights = [1 / rank for rank in range(1, len(vocab) + 1)]
+        for start in range(0, books, CHUNK):
+            rows = []
+            for i in range(start, min(books, start + CHUNK)):
+                name = ' '.join(rng.choices(vocab, weights, k=rng.randint(1, 4))).title()
+                author = ' '.join(rng.choices(vocab, weights, k=2)).title()
+                if i % 100000 == 0:
+                    name = TITLES[i // 100000 % len(TITLES)]
+                elif i % 100000 < 6:
+                    name = f'Q{rng.choice(["dnue", "emna", "lrod"])}q{name.lower()}'
+                rows.append({'name': name, 'author': author, 'year_published': 1900 + i % 124, 'book_type': 1 + i % 3})
+            db.session.execute(db.insert(Book), rows)
+            db.session.commit()
+        # The titles that must be found, whatever --books is
+        db.session.execute(db.insert(Book), [
+            {'name': title, 'author': 'Someone', 'year_published': 2000, 'book_type': 1} for title in TITLES
+        ])
+        db.session.commit()
+    return round(time.perf_counter() - started, 1)
+
+
+def run(workdir, repeat):
+    app = load_app(workdir, {'OVERDUE_SCHEDULER': 'off', 'RATE_LIMIT': False})
+    from extensions import db
+    from models import Book
+    from search import book_index
+    results = {}
+    with app.app_context():
+        for query, title in QUERIES:
+            ids, _ = book_index.search(db.session, query, 20)  # Warm the page cache
+            latencies = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                ids, _ = book_index.search(db.session, query, 20)
+                latencies.append(time.perf_counter() - started)
+            first = db.session.get(Book, ids[0]).name if ids else None
+            results[query] = dict(summarize(latencies), results=len(ids), first=first, found=title is None or first == title)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--workdir', required=True)
+    parser.add_argument('--backend', default=BACKEND)
+    parser.add_argument('--books', type=int, default=1000000)
+    parser.add_argument('--words', type=int, default=50000, help='size of the made-up vocabulary')
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--budget-ms', type=float, default=10)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    marker = os.path.join(args.workdir, 'search_scale.json')
+    if not os.path.exists(marker) or json.load(open(marker)).get('books') != args.books:
+        copy_backend(args.backend, args.workdir)
+        for name in ('database.db', 'database.db-wal', 'database.db-shm'):
+            if os.path.exists(os.path.join(args.workdir, 'instance', name)):
+                os.remove(os.path.join(args.workdir, 'instance', name))
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(1) as pool:
+            seconds = pool.apply(build, (args.workdir, args.books, args.words, args.seed))
+        with open(marker, 'w') as output:
+            json.dump({'books': args.books}, output)
+        print(f'Inserted {args.books} books in {seconds}s')
+
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1) as pool:
+        results = pool.apply(run, (args.workdir, args.repeat))
+    failed = False
+    print(f"{'query':<14}{'p50 ms':>9}{'p95 ms':>9}  first result")
+    for query, result in results.items():
+        slow = result['p95_ms'] > args.budget_ms
+        failed = failed or slow or not result['found']
+        flags = ' (slow)' * slow + ' (wrong)' * (not result['found'])
+        print(f"{query:<14}{result['p50_ms']:>9}{result['p95_ms']:>9}  {result['first']}{flags}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""Create a benchmark database with a given number of books, users and loans.
+
+    python bench/seed.py --workdir /tmp/library-bench --books 100000 --users 10000 --loans 100000
+
+The backend is copied into --workdir and its database is built there:
+- every user has the password 'bench', and user 1 is an admin;
+- a tenth of the loans (at most half the books) are still open, half of
+  those overdue, and the rest are returned history;
+- --spare extra books and users at the end of the id range are never
+  loaned, so benchmarks can delete them.
+A description of the data, including tokens for the first --clients
+users, is written to seed.json in the workdir.
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from werkzeug.security import generate_password_hash
+
+from common import BACKEND, copy_backend, load_app
+
+
+CHUNK = 50000
+WORDS = ['river', 'night', 'garden', 'stone', 'winter', 'silver', 'shadow', 'harbor', 'letter', 'forest',
+         'mirror', 'summer', 'island', 'desert', 'castle', 'window', 'ember', 'orchard', 'lantern', 'meadow']
+CITIES = ['Haifa', 'Tel Aviv', 'Jerusalem', 'Eilat', 'Nazareth', 'Ashdod', 'Tiberias', 'Beersheba']
+
+
+def insert_chunks(db, model, rows):
+    for start in range(0, len(rows), CHUNK):
+        db.session.execute(db.insert(model), rows[start:start + CHUNK])
+        db.session.commit()
+
+
+def cover_png():
+    from PIL import Image
+    data = io.BytesIO()
+    Image.new('RGB', (600, 900), (90, 120, 160)).save(data, 'PNG')
+    return data.getvalue()
+
+
+def build(workdir, books, users, loans, spare, clients, seed):
+    random.seed(seed)
+    app = load_app(workdir, {'OVERDUE_SCHEDULER': 'off', 'RATE_LIMIT': False})
+    from extensions import db, upgrade_database
+    from loans import scan_overdue_loans
+    from models import Book, Loan, User
+    from stats import rebuild_stats
+    started = time.perf_counter()
+    upgrade_database(app)
+    with app.app_context():
+        # Hashed here: pool workers are daemonic and cannot start the hash pool
+        password = generate_password_hash('bench', app.config['PASSWORD_HASH_METHOD'], app.config['PASSWORD_SALT_LENGTH'])
+        total_users = users + spare
+        insert_chunks(db, User, [
+            {'name': f'{random.choice(WORDS)} {random.choice(WORDS)}', 'city': random.choice(CITIES), 'age': 18 + i % 60,
+             'username': f'bench{i + 1}', 'password': password, 'is_admin': i == 0}
+            for i in range(total_users)
+        ])
+
+        # Open loans go to the first books, held by users other than the spare ones
+        now = datetime.utcnow()
+        open_loans = min(loans // 10, books // 2)
+        holders = [1 + i % users for i in range(open_loans)]
+        insert_chunks(db, Book, [
+            {'name': f'{random.choice(WORDS)} {random.choice(WORDS)} {i + 1}', 'author': f'{random.choice(WORDS)} {random.choice(WORDS)}',
+             'year_published': 1900 + i % 124, 'book_type': 1 + i % 3, 'customer_id': holders[i] if i < open_loans else None}
+            for i in range(books + spare)
+        ])
+
+        rows = []
+        for i in range(open_loans):
+            loan_date = now - timedelta(days=random.randint(0, 20), minutes=random.randint(0, 1440))
+            due_date = now - timedelta(days=random.randint(1, 10)) if i % 2 else now + timedelta(days=random.randint(1, 10))
+            rows.append({'book_id': i + 1, 'customer_id': holders[i], 'loan_date': loan_date, 'due_date': due_date})
+        for i in range(loans - open_loans):
+            loan_date = now - timedelta(days=random.randint(30, 3000))
+            rows.append({'book_id': random.randint(1, books), 'customer_id': random.randint(1, users), 'loan_date': loan_date,
+                         'due_date': loan_date + timedelta(days=10), 'return_date': loan_date + timedelta(days=random.randint(1, 20))})
+        rows.sort(key=lambda row: row['loan_date'])
+        insert_chunks(db, Loan, rows)
+        rebuild_stats()
+        scan_overdue_loans(app)
+
+        # One book with a cover, for /uploads
+        client = app.test_client()
+        token = db.session.get(User, 1).generate_token()
+        client.post('/books', headers={'Authorization': f'Bearer {token}'}, data={
+            'name': 'cover book', 'author': 'bench', 'year_published': '2000', 'book_type': '1',
+            'image': (io.BytesIO(cover_png()), 'cover.png')
+        })
+        cover = Book.query.order_by(Book.id.desc()).first()
+
+        info = {
+            'books': books, 'users': users, 'loans': loans, 'spare': spare, 'open_loans': open_loans,
+            'tokens': [user.generate_token() for user in User.query.order_by(User.id).limit(clients)],
+            'cover': cover.image_path.replace(os.sep, '/'),
+            'cover_book': cover.id,
+            'seconds': round(time.perf_counter() - started, 1),
+        }
+    with open(os.path.join(workdir, 'seed.json'), 'w') as output:
+        json.dump(info, output)
+    return info
+
+
+def seed(workdir, books, users, loans, spare=1000, clients=16, backend=BACKEND, seed=1):
+    # Build the database in a fresh process so the app is imported from workdir
+    copy_backend(backend, workdir)
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1) as pool:
+        return pool.apply(build, (workdir, books, users, loans, spare, clients, seed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--workdir', required=True)
+    parser.add_argument('--backend', default=BACKEND)
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--loans', type=int, default=10000)
+    parser.add_argument('--spare', type=int, default=1000, help='extra books and users that may be deleted')
+    parser.add_argument('--clients', type=int, default=16, help='users to write tokens for')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    info = seed(args.workdir, args.books, args.users, args.loans, args.spare, args.clients, args.backend, args.seed)
+    print(f"Seeded {args.books} books, {args.users} users and {args.loans} loans in {info['seconds']}s into {args.workdir}")
+
+
+if __name__ == '__main__':
+    main()
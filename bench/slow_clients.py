@@ -0,0 +1,169 @@
+"""Compare catalog read latency while slow clients upload and download, WSGI vs ASGI.
+
+    python bench/slow_clients.py --slow 16 --threads 4 --duration 5
+
+The backend is copied and seeded into a temporary directory (or --workdir).
+It is then served by a single process in each mode in turn, with --threads
+threads for views:
+    wsgi  gunicorn with gthread workers (wsgi:app)
+    asgi  uvicorn (asgi:app), with ASGI_THREADS=--threads
+Each mode first measures GET /books from --readers clients on their own,
+then again while --slow clients trickle cover uploads to POST /books and
+--slow clients read a large file from /uploads a few KB at a time. Reads
+that take longer than --timeout seconds count as errors.
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import requests
+
+from common import BACKEND, summarize
+from http_load import free_port
+from seed import seed
+
+
+BIG_FILE = 'uploads/slow-download.bin'
+
+
+def start_server(mode, workdir, port, threads):
+    env = dict(os.environ, FLASK_OVERDUE_SCHEDULER='off', FLASK_RATE_LIMIT='false',
+               FLASK_ASGI_THREADS=str(threads))
+    if mode == 'wsgi':
+        command = [sys.executable, '-m', 'gunicorn', '--workers', '1', '--worker-class', 'gthread', '--threads', str(threads),
+                   '--bind', f'127.0.0.1:{port}', '--log-level', 'warning', 'wsgi:app']
+    else:
+        command = [sys.executable, '-m', 'uvicorn', '--port', str(port), '--log-level', 'warning', 'asgi:app']
+    # Started outside workdir so gunicorn does not pick up its gunicorn.conf.py
+    process = subprocess.Popen(command, cwd=os.path.dirname(workdir), env=dict(env, PYTHONPATH=workdir))
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            requests.get(f'http://127.0.0.1:{port}/metrics', timeout=1)
+            return process
+        except requests.RequestException:
+            if process.poll() is not None:
+                raise RuntimeError(f'the {mode} server exited during startup')
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f'the {mode} server did not start')
+
+
+def slow_upload(port, token, stop, size):
+    # A multipart POST /books whose body arrives 1 KB every 100 ms
+    boundary = uuid.uuid4().hex
+    fields = ''.join(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+                     for name, value in (('name', 'slow upload'), ('author', 'bench'), ('year_published', '2000'), ('book_type', '1')))
+    body = (fields + f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="cover.png"\r\n'
+            'Content-Type: image/png\r\n\r\n').encode() + b'\0' * size + f'\r\n--{boundary}--\r\n'.encode()
+    with socket.create_connection(('127.0.0.1', port)) as connection:
+        connection.sendall((f'POST /books HTTP/1.1\r\nHost: localhost\r\nAuthorization: Bearer {token}\r\n'
+                            f'Content-Type: multipart/form-data; boundary={boundary}\r\nContent-Length: {len(body)}\r\n\r\n').encode())
+        for start in range(0, len(body), 1024):
+            if stop.is_set():
+                return
+            connection.sendall(body[start:start + 1024])
+            time.sleep(0.1)
+
+
+def slow_download(port, stop):
+    # Reads the large file 4 KB every 100 ms through a small receive buffer
+    connection = socket.socket()
+    connection.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    with connection:
+        connection.connect(('127.0.0.1', port))
+        connection.sendall(f'GET /{BIG_FILE} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode())
+        while not stop.is_set() and connection.recv(4096):
+            time.sleep(0.1)
+
+
+def read_catalog(port, token, readers, duration, timeout):
+    latencies, errors = [], [0]
+    stop = time.perf_counter() + duration
+
+    def reader():
+        session = requests.Session()
+        while time.perf_counter() < stop:
+            sent = time.perf_counter()
+            try:
+                response = session.get(f'http://127.0.0.1:{port}/books?limit=20', headers={'Authorization': f'Bearer {token}'}, timeout=timeout)
+            except requests.RequestException:
+                errors[0] += 1
+                continue
+            if response.status_code != 200:
+                errors[0] += 1
+            latencies.append(time.perf_counter() - sent)
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result = {'requests': len(latencies), 'errors': errors[0], 'throughput': round(len(latencies) / duration, 1)}
+    result.update(summarize(latencies))
+    return result
+
+
+def run_mode(mode, workdir, info, args):
+    port = free_port()
+    server = start_server(mode, workdir, port, args.threads)
+    stop = threading.Event()
+    slow = []
+    try:
+        results = {'alone': read_catalog(port, info['tokens'][0], args.readers, args.duration, args.timeout)}
+        slow += [threading.Thread(target=slow_upload, args=(port, info['tokens'][i % len(info['tokens'])], stop, args.upload_size))
+                 for i in range(args.slow)]
+        slow += [threading.Thread(target=slow_download, args=(port, stop)) for _ in range(args.slow)]
+        for thread in slow:
+            thread.start()
+        time.sleep(1)  # Let the slow clients settle in
+        results['with slow clients'] = read_catalog(port, info['tokens'][0], args.readers, args.duration, args.timeout)
+    finally:
+        stop.set()
+        server.terminate()
+        server.wait(timeout=30)
+    for thread in slow:
+        thread.join()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--backend', default=BACKEND)
+    parser.add_argument('--workdir', help='directory to seed, a temporary one by default')
+    parser.add_argument('--mode', action='append', choices=['wsgi', 'asgi'], help='may be repeated, both by default')
+    parser.add_argument('--threads', type=int, default=4, help='threads for views')
+    parser.add_argument('--slow', type=int, default=16, help='slow uploads, and as many slow downloads')
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=5, help='seconds per measurement')
+    parser.add_argument('--timeout', type=float, default=5, help='seconds before a read counts as an error')
+    parser.add_argument('--upload-size', type=int, default=1024 * 1024, help='bytes per slow upload')
+    parser.add_argument('--download-size', type=int, default=64 * 1024 * 1024, help='bytes of the slowly read file')
+    parser.add_argument('--output', help='write the results as JSON')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='library-slow-') as temporary:
+        workdir = args.workdir or temporary
+        info = seed(workdir, 2000, 100, 2000, spare=0)
+        with open(os.path.join(workdir, BIG_FILE), 'wb') as big_file:
+            big_file.truncate(args.download_size)
+        results = {}
+        for mode in args.mode or ['wsgi', 'asgi']:
+            results[mode] = run_mode(mode, workdir, info, args)
+            for name, result in results[mode].items():
+                print(f"{mode} {name:18} {result['throughput']:8.1f} req/s  p50 {result['p50_ms']} ms  "
+                      f"p95 {result['p95_ms']} ms  p99 {result['p99_ms']} ms  errors {result['errors']}", flush=True)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
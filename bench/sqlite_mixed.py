@@ -0,0 +1,155 @@
+"""Measure mixed read/write throughput against one shared SQLite file.
+
+Every process runs its own copy of the app, like gunicorn workers do, and
+sends a mix of reads (book pages, searches, loan pages) and writes (loans,
+returns, book edits). The same workload is run once per profile:
+
+    baseline  rollback journal, synchronous=FULL, SQLite's default caches
+    tuned     the app's defaults: WAL, synchronous=NORMAL, mmap, 64 MB cache
+
+    python bench/sqlite_mixed.py --processes 8 --duration 10 --writes 0.2
+
+The profiles are applied through FLASK_SQLITE_* environment variables, the
+same way a deployment would override them. The backend tree is copied to a
+temporary directory for every profile, so the real database is never touched.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+
+PROFILES = {
+    'baseline': {
+        'FLASK_SQLITE_JOURNAL_MODE': 'delete',
+        'FLASK_SQLITE_SYNCHRONOUS': 'full',
+        'FLASK_SQLITE_MMAP_SIZE': '0',
+        'FLASK_SQLITE_CACHE_SIZE': '-2000',
+    },
+    'tuned': {},
+}
+
+WORDS = ['river', 'night', 'garden', 'stone', 'winter', 'silver', 'shadow', 'harbor', 'letter', 'forest']
+
+
+def load_app(workdir):
+    os.chdir(workdir)
+    sys.path.insert(0, workdir)
+    from app import create_app
+    return create_app({'RATE_LIMIT': False})
+
+
+def setup(workdir, users, books):
+    app = load_app(workdir)
+    from extensions import db, upgrade_database
+    from models import Book, User
+    upgrade_database(app)
+    with app.app_context():
+        for i in range(users):
+            db.session.add(User(name=f'mixed {i}', city='bench', username=f'mixed{i}', password='x', is_admin=True))
+        db.session.execute(db.insert(Book), [
+            {'name': f'{random.choice(WORDS)} {random.choice(WORDS)} {i}', 'author': random.choice(WORDS),
+             'year_published': 1900 + i % 120, 'book_type': 1 + i % 3}
+            for i in range(books)
+        ])
+        db.session.commit()
+        return [user.generate_token() for user in User.query.order_by(User.id).all()]
+
+
+def run_worker(workdir, token, books, duration, writes, results):
+    client = load_app(workdir).test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+    counts = {'reads': 0, 'writes': 0, 'errors': 0, 'busy': 0, 'read_time': 0.0, 'write_time': 0.0}
+    held = set()
+    started = time.perf_counter()
+    while time.perf_counter() - started < duration:
+        book_id = random.randint(1, books)
+        if random.random() < writes:
+            kind = 'write'
+            choice = random.random()
+            sent = time.perf_counter()
+            if held and choice < 0.4:
+                book_id = held.pop()
+                response = client.post(f'/books/{book_id}/return', headers=headers)
+            elif choice < 0.8:
+                response = client.post(f'/books/{book_id}/loan', headers=headers)
+                if response.status_code == 200:
+                    held.add(book_id)
+            else:
+                response = client.put(f'/books/{book_id}', headers=headers,
+                                      data={'name': f'{random.choice(WORDS)} edition {book_id}'})
+        else:
+            kind = 'read'
+            choice = random.random()
+            sent = time.perf_counter()
+            if choice < 0.5:
+                response = client.get(f'/books?limit=50&author={random.choice(WORDS)}', headers=headers)
+            elif choice < 0.8:
+                response = client.get(f'/books/find?q={random.choice(WORDS)}&limit=20')
+            else:
+                response = client.get('/loans?limit=50')
+        counts[kind + '_time'] += time.perf_counter() - sent
+        counts[kind + 's'] += 1
+        if response.status_code == 503:
+            counts['busy'] += 1
+        elif response.status_code >= 500:
+            counts['errors'] += 1
+    counts['elapsed'] = time.perf_counter() - started
+    results.put(counts)
+
+
+def run_profile(name, args):
+    os.environ.update(PROFILES[name])
+    workdir = tempfile.mkdtemp(prefix=f'sqlite-mixed-{name}-')
+    try:
+        shutil.copytree(args.backend, workdir, dirs_exist_ok=True,
+                        ignore=shutil.ignore_patterns('*.db', 'uploads', 'thumbnails', '__pycache__'))
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(1) as pool:
+            tokens = pool.apply(setup, (workdir, args.processes, args.books))
+
+        results = context.Queue()
+        workers = [context.Process(target=run_worker, args=(workdir, token, args.books, args.duration, args.writes, results))
+                   for token in tokens]
+        for worker in workers:
+            worker.start()
+        totals = {}
+        for _ in workers:
+            for key, value in results.get().items():
+                totals[key] = totals.get(key, 0) + value
+        for worker in workers:
+            worker.join()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+        for key in PROFILES[name]:
+            del os.environ[key]
+
+    elapsed = totals['elapsed'] / len(workers)
+    requests = totals['reads'] + totals['writes']
+    print(f"{name:9} {requests / elapsed:7.0f} req/s  "
+          f"reads {totals['reads'] / elapsed:6.0f}/s avg {1000 * totals['read_time'] / max(totals['reads'], 1):6.1f} ms  "
+          f"writes {totals['writes'] / elapsed:5.0f}/s avg {1000 * totals['write_time'] / max(totals['writes'], 1):6.1f} ms  "
+          f"503 {totals['busy']}  500 {totals['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--backend', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--books', type=int, default=20000)
+    parser.add_argument('--duration', type=float, default=10, help='seconds per profile')
+    parser.add_argument('--writes', type=float, default=0.2, help='share of requests that write')
+    parser.add_argument('--profile', choices=sorted(PROFILES), action='append',
+                        help='profile to run, may be repeated (default: all)')
+    args = parser.parse_args()
+
+    for name in args.profile or ['baseline', 'tuned']:
+        run_profile(name, args)
+
+
+if __name__ == '__main__':
+    main()
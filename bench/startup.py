@@ -0,0 +1,146 @@
+"""Measure app import time, gunicorn startup time and memory per worker.
+
+    python bench/startup.py --workers 4
+    python bench/startup.py --backend /path/to/older/backend --target app:app
+
+The import time is the median over --runs fresh interpreters importing the
+--target module and looking up the app, which is what every worker pays
+when the app is not preloaded. gunicorn is then started twice, without and
+with --preload (and the tree's gunicorn.conf.py when it has one), and each
+time reports how long it took to answer its first request and, after some
+warm-up requests, the RSS, USS (memory private to the process) and PSS
+(memory with shared pages split between their users) of the master and
+its workers. USS is the memory a worker really adds; it shrinks when the
+workers share the pages of a preloaded app.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+from common import BACKEND, children, copy_backend
+from http_load import free_port
+
+
+IMPORT_SCRIPT = '''
+import importlib, sys, time
+module_name, attribute = sys.argv[1].split(':')
+sys.path.insert(0, '.')
+started = time.perf_counter()
+getattr(importlib.import_module(module_name), attribute)
+elapsed = time.perf_counter() - started
+rss = [int(line.split()[1]) for line in open('/proc/self/status') if line.startswith('VmRSS:')][0]
+print(elapsed, rss, len(sys.modules))
+'''
+
+
+def memory_kb(pid):
+    # {'rss': .., 'pss': .., 'uss': ..} in kB from /proc/<pid>/smaps_rollup
+    values = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as rollup:
+            for line in rollup:
+                name, _, rest = line.partition(':')
+                if name in ('Rss', 'Pss', 'Private_Clean', 'Private_Dirty'):
+                    values[name] = int(rest.split()[0])
+    except OSError:
+        return None
+    return {'rss': values['Rss'], 'pss': values['Pss'], 'uss': values['Private_Clean'] + values['Private_Dirty']}
+
+
+def import_time(workdir, target, runs, env):
+    timings, rss, modules = [], [], 0
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', IMPORT_SCRIPT, target], cwd=workdir, env=env,
+                                capture_output=True, text=True, check=True).stdout.split()
+        timings.append(float(output[0]))
+        rss.append(int(output[1]))
+        modules = int(output[2])
+    return {'import_ms': round(statistics.median(timings) * 1000, 1), 'import_rss_mb': round(statistics.median(rss) / 1024, 1),
+            'modules': modules}
+
+
+def serve(workdir, target, workers, preload, warmup, env):
+    port = free_port()
+    command = [sys.executable, '-m', 'gunicorn', '--chdir', workdir, '--workers', str(workers), '--worker-class', 'gthread',
+               '--threads', '4', '--bind', f'127.0.0.1:{port}', '--log-level', 'warning']
+    if preload:
+        if os.path.exists(os.path.join(workdir, 'gunicorn.conf.py')):
+            command += ['--config', os.path.join(workdir, 'gunicorn.conf.py')]
+        command.append('--preload')
+    # gunicorn also reads ./gunicorn.conf.py on its own, so only start it in
+    # the backend directory when that file is wanted
+    started = time.perf_counter()
+    process = subprocess.Popen(command + [target], cwd=workdir if preload else os.path.dirname(workdir), env=env)
+    try:
+        url = f'http://127.0.0.1:{port}/metrics'
+        while True:
+            try:
+                requests.get(url, timeout=1)
+                break
+            except requests.RequestException:
+                if process.poll() is not None or time.perf_counter() - started > 120:
+                    raise RuntimeError('gunicorn did not start')
+                time.sleep(0.02)
+        ready = time.perf_counter() - started
+        # Fresh connections, so that the requests reach every worker
+        for _ in range(warmup):
+            requests.get(url, headers={'Connection': 'close'})
+        while len(children(process.pid)) < workers:
+            time.sleep(0.05)
+        master = memory_kb(process.pid)
+        per_worker = [memory_kb(pid) for pid in children(process.pid)]
+        per_worker = [memory for memory in per_worker if memory]
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+    def mean_mb(key):
+        return round(statistics.mean(memory[key] for memory in per_worker) / 1024, 1)
+
+    return {
+        'ready_ms': round(ready * 1000, 1),
+        'master_rss_mb': round(master['rss'] / 1024, 1),
+        'worker_rss_mb': mean_mb('rss'),
+        'worker_uss_mb': mean_mb('uss'),
+        'worker_pss_mb': mean_mb('pss'),
+        'total_pss_mb': round((master['pss'] + sum(memory['pss'] for memory in per_worker)) / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--backend', default=BACKEND)
+    parser.add_argument('--target', default='wsgi:app', help='module:attribute of the WSGI app')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--runs', type=int, default=5, help='interpreters to time the import in')
+    parser.add_argument('--warmup', type=int, default=50, help='requests sent before memory is read')
+    parser.add_argument('--output', help='write the results as JSON')
+    args = parser.parse_args()
+
+    # The scheduler would read the (empty) copied database; it is not what is measured here
+    env = dict(os.environ, FLASK_OVERDUE_SCHEDULER='off')
+    with tempfile.TemporaryDirectory(prefix='library-startup-') as workdir:
+        copy_backend(args.backend, workdir)
+        results = {'import': import_time(workdir, args.target, args.runs, env)}
+        print(f"import {results['import']['import_ms']} ms, {results['import']['import_rss_mb']} MB RSS, "
+              f"{results['import']['modules']} modules", flush=True)
+        for name, preload in (('gunicorn', False), ('gunicorn --preload', True)):
+            results[name] = serve(workdir, args.target, args.workers, preload, args.warmup, env)
+            result = results[name]
+            print(f"{name:20} ready {result['ready_ms']} ms  master {result['master_rss_mb']} MB  per worker: "
+                  f"RSS {result['worker_rss_mb']} MB  USS {result['worker_uss_mb']} MB  PSS {result['worker_pss_mb']} MB  "
+                  f"total PSS {result['total_pss_mb']} MB", flush=True)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()